@@ -1,5 +1,6 @@
 import numpy as np
 import utils
+from loanBook import LoanBook
 from scipy.stats import norm
 
 
@@ -7,11 +8,14 @@ class DynamicLBProtocol:
     def __init__(self, volatility: float, price: float, pi: float, pi_total: float):
         self.totalC = 0
         self.totalD = 0
-        # The balanceSheet is an array containing CDR ratios, collateral, debt, and address for each loan.
-        self.balanceSheet = np.empty((0, 4), int)
+        # The loan book holds the CDR ratio, debt, collateral and address of each loan, sorted by CDR.
+        self.loans = LoanBook()
         self.recoveryMode = False
         self.pi = pi
         self.pi_total = pi_total
+        # norm.ppf dominated the cost of an order, the quantiles are computed once
+        self.pi_quantile = norm.ppf(pi)
+        self.pi_total_quantile = norm.ppf(pi_total)
         self.price = price
         self.vol = volatility
         self.liqidationRewards = 0
@@ -20,7 +24,7 @@ class DynamicLBProtocol:
         threshold = 0
         if not self.recoveryMode:
             optimalExecution = True
-            threshold = 1 + self.vol * norm.ppf(self.pi)
+            threshold = 1 + self.vol * self.pi_quantile
             x = (
                 utils.estimate_execution_cost(
                     self.vol, loan_amount, self.price, optimalExecution
@@ -30,7 +34,7 @@ class DynamicLBProtocol:
             return threshold + x
 
         else:
-            threshold = 1 + self.vol * norm.ppf(self.pi_total)
+            threshold = 1 + self.vol * self.pi_total_quantile
             optimalExecution = True
             x = (
                 utils.estimate_execution_cost(
@@ -49,32 +53,27 @@ class DynamicLBProtocol:
 
         else:
             print("Loan order placed.")
-            self.balanceSheet = np.vstack(
-                [self.balanceSheet, [CDR, debt, collateral, address]]
-            )
+            self.loans.insert(CDR, debt, collateral, address)
             self.totalC += collateral
             self.totalD += debt
-            self.balanceSheet = self.balanceSheet[self.balanceSheet[:, 0].argsort()]
 
         self.set_recovery_mode(self.vol)
 
         return True
 
     def withdraw_collateral(self, address: int) -> bool:
-        if address not in self.balanceSheet[:, 3]:
+        if address not in self.loans:
             print("No loans found with this address.")
             return False
 
         else:
-            self.totalD -= self.balanceSheet[self.balanceSheet[:, 3] == address][1]
-            self.totalC -= self.balanceSheet[self.balanceSheet[:, 3] == address][2]
+            loans = self.loans.remove_address(address)
+            self.totalD -= loans["debt"].sum()
+            self.totalC -= loans["collateral"].sum()
             self.set_recovery_mode(self.vol)
             print(
                 "You've successfully repaid your debt to the protocol, and receive a collateral of ",
-                self.balanceSheet[self.balanceSheet[:, 3] == address][2],
-            )
-            self.balanceSheet = np.delete(
-                self.balanceSheet, self.balanceSheet[:, 3] == address
+                loans["collateral"].sum(),
             )
             return True
 
@@ -83,14 +82,14 @@ class DynamicLBProtocol:
             self.recoveryMode = False
             return
 
-        if (self.totalC / self.totalD) < (1 + volatility * norm.ppf(self.pi_total)):
+        if (self.totalC / self.totalD) < (1 + volatility * self.pi_total_quantile):
             self.recoveryMode = True
         else:
             self.recoveryMode = False
         return
 
     def get_recovery_Threshold(self) -> float:
-        return 1 + self.vol * norm.ppf(self.pi_total)
+        return 1 + self.vol * self.pi_total_quantile
 
     def update_vars(self, new_vol: float, new_price: float):
         if self.totalD == 0:
@@ -99,14 +98,19 @@ class DynamicLBProtocol:
 
         else:
             self.totalC *= new_price / self.price
-            self.balanceSheet[:, 2] *= new_price / self.price
-            self.balanceSheet[:, 0] *= new_price / self.price
+            self.loans.scale_collateral(new_price / self.price)
             self.set_recovery_mode(new_vol)
             self.price = new_price
             self.vol = new_vol
 
         return
 
+    @property
+    def balanceSheet(self) -> np.ndarray:
+        # CDR, debt, collateral and address columns, sorted by CDR
+        loans = self.loans.sorted()
+        return np.column_stack([loans["cdr"], loans["debt"], loans["collateral"], loans["address"]])
+
     def status(self):
         print("Protocol's Status Summary")
         print("-----------------------------------")
@@ -114,12 +118,12 @@ class DynamicLBProtocol:
         print("Cummulative Collateral:", self.totalC)
         print("Total CDR:", self.totalC * 100 / self.totalD)
         print(
-            "Minimum Total Collateral:", (1 + self.vol * norm.ppf(self.pi_total)) * 100
+            "Minimum Total Collateral:", (1 + self.vol * self.pi_total_quantile) * 100
         )
         if self.recoveryMode:
             print(
                 "Recovery Mode is activated. Liquidations will happen until total CDR hits ",
-                (1 + self.vol * norm.ppf(self.pi_total)) * 100,
+                (1 + self.vol * self.pi_total_quantile) * 100,
                 ".",
             )
         else:
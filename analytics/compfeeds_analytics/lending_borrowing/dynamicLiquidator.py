@@ -1,3 +1,4 @@
+import numpy as np
 import utils
 from dynamicLB import DynamicLBProtocol
 
@@ -9,34 +10,46 @@ class DynamicLiquidator:
 
     def check_liquidity_opportunities(self, protocol: DynamicLBProtocol):
         if protocol.recoveryMode:
-            while protocol.recoveryMode:
-                self.liquidate(protocol, 0)
+            # Lowest CDR first until the protocol leaves recovery mode. The totals left after
+            # each prefix of the CDR order give how many loans go, they are removed at once
+            loans = protocol.loans.sorted()
+            remainingD = protocol.totalD - np.cumsum(loans["debt"])
+            remainingC = protocol.totalC - np.cumsum(loans["collateral"])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                recovered = (remainingD == 0) | (remainingC / remainingD >= protocol.get_recovery_Threshold())
+            count = int(np.argmax(recovered)) + 1 if recovered.any() else len(loans)
+            self.liquidate_slots(protocol, protocol.loans.slots()[:count])
         else:
-            for i in range(len(protocol.balanceSheet)):
-                if (
-                    protocol.balanceSheet[i, 2] / protocol.balanceSheet[i, 1]
-                ) < protocol.calculate_liquidation_threshold(
-                    self, protocol.balanceSheet[i, 2]
-                ):
-                    self.liquidate(protocol, i)
+            # Every loan's threshold is computed at once, then all loans below it are liquidated together
+            slots = protocol.loans.slots()
+            loans = protocol.loans.loans[slots]
+            thresholds = protocol.calculate_liquidation_threshold(loans["debt"])
+            self.liquidate_slots(protocol, slots[loans["cdr"] < thresholds])
 
     def liquidate(self, protocol: DynamicLBProtocol, i: int):
-        protocol.totalD -= protocol.balanceSheet[i][1]
-        protocol.totalC -= protocol.balanceSheet[i][2]
-        liquidatorReward = protocol.balanceSheet[i][
-            1
-        ] * 0.005 + utils.estimate_execution_cost(
+        # i is the loan's position in CDR order
+        self.settle(protocol, protocol.loans.remove_at(i))
+        protocol.set_recovery_mode(protocol.vol)
+
+        return
+
+    def liquidate_slots(self, protocol: DynamicLBProtocol, slots):
+        if len(slots):
+            self.settle(protocol, protocol.loans.remove_slots(slots))
+            protocol.set_recovery_mode(protocol.vol)
+
+        return
+
+    def settle(self, protocol: DynamicLBProtocol, loans):
+        protocol.totalD -= loans["debt"].sum()
+        protocol.totalC -= loans["collateral"].sum()
+        liquidatorReward = loans["debt"] * 0.005 + utils.estimate_execution_cost(
             protocol.vol,
-            protocol.balanceSheet[i][1],
+            loans["debt"],
             protocol.price,
             True,
         )
         protocol.liqidationRewards += (
-            protocol.balanceSheet[i][2] - protocol.balanceSheet[i][1] - liquidatorReward
-        )
-        self.reward += liquidatorReward
-
-        protocol.balanceSheet.delete(i)
-        protocol.set_recovery_mode(protocol.vol)
-
-        return
+            loans["collateral"] - loans["debt"] - liquidatorReward
+        ).sum()
+        self.reward += liquidatorReward.sum()
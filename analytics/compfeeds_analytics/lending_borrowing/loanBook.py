@@ -0,0 +1,116 @@
+import numpy as np
+
+LOAN_DTYPE = np.dtype(
+    [("cdr", np.float64), ("debt", np.float64), ("collateral", np.float64), ("address", np.int64)]
+)
+
+
+class LoanBook:
+    # Loans are stored in a preallocated structured array of slots that doubles when full.
+    # A slot never moves once written, so the address index maps each address straight to
+    # its slots. The CDR order is kept in two parallel arrays, the sorted CDRs and their
+    # slots: an insert finds its position with searchsorted and shifts the tail by one.
+    def __init__(self, capacity: int = 1024):
+        self.loans = np.zeros(capacity, dtype=LOAN_DTYPE)
+        self.sorted_cdr = np.zeros(capacity, dtype=np.float64)
+        self.order = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self.used = 0
+        self.free = []
+        self.index = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, address: int) -> bool:
+        return address in self.index
+
+    def grow(self):
+        capacity = 2 * len(self.loans)
+        for name in ["loans", "sorted_cdr", "order"]:
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+
+    def insert(self, cdr: float, debt: float, collateral: float, address: int) -> int:
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.used == len(self.loans):
+                self.grow()
+            slot = self.used
+            self.used += 1
+        self.loans[slot] = (cdr, debt, collateral, address)
+        position = np.searchsorted(self.sorted_cdr[: self.size], cdr, side="right")
+        self.sorted_cdr[position + 1 : self.size + 1] = self.sorted_cdr[position : self.size]
+        self.order[position + 1 : self.size + 1] = self.order[position : self.size]
+        self.sorted_cdr[position] = cdr
+        self.order[position] = slot
+        self.size += 1
+        self.index.setdefault(address, []).append(slot)
+        return slot
+
+    def position_of(self, slot: int) -> int:
+        # Loans with the same CDR sit next to each other, the run is scanned for the slot
+        cdr = self.loans["cdr"][slot]
+        position = np.searchsorted(self.sorted_cdr[: self.size], cdr, side="left")
+        while self.order[position] != slot:
+            position += 1
+        return position
+
+    def remove_slot(self, slot: int) -> np.void:
+        loan = self.loans[slot].copy()
+        position = self.position_of(slot)
+        self.sorted_cdr[position : self.size - 1] = self.sorted_cdr[position + 1 : self.size]
+        self.order[position : self.size - 1] = self.order[position + 1 : self.size]
+        self.size -= 1
+        slots = self.index[loan["address"]]
+        slots.remove(slot)
+        if not slots:
+            del self.index[loan["address"]]
+        self.free.append(slot)
+        return loan
+
+    def remove_address(self, address: int) -> np.ndarray:
+        """Removes every loan of `address` and returns them."""
+        slots = list(self.index.get(address, []))
+        return np.array([self.remove_slot(slot) for slot in slots], dtype=LOAN_DTYPE)
+
+    def remove_at(self, position: int) -> np.void:
+        """Removes the loan at `position` in CDR order (0 is the lowest CDR) and returns it."""
+        return self.remove_slot(self.order[position])
+
+    def remove_slots(self, slots) -> np.ndarray:
+        """Removes many loans at once, compacting the CDR order in a single pass."""
+        # Copied, `slots` may be a view of the order compacted below
+        slots = np.array(slots, dtype=np.int64)
+        removed = self.loans[slots].copy()
+        keep = ~np.isin(self.order[: self.size], slots)
+        remaining = int(keep.sum())
+        self.sorted_cdr[:remaining] = self.sorted_cdr[: self.size][keep]
+        self.order[:remaining] = self.order[: self.size][keep]
+        self.size = remaining
+        for slot, address in zip(slots.tolist(), removed["address"].tolist()):
+            self.index[address].remove(slot)
+            if not self.index[address]:
+                del self.index[address]
+        self.free.extend(slots.tolist())
+        return removed
+
+    def by_address(self, address: int) -> np.ndarray:
+        return self.loans[self.index.get(address, [])]
+
+    def slots(self) -> np.ndarray:
+        """Slots in CDR order."""
+        return self.order[: self.size]
+
+    def sorted(self) -> np.ndarray:
+        """Copy of the loans in CDR order."""
+        return self.loans[self.slots()]
+
+    def scale_collateral(self, factor: float):
+        # Every CDR scales by the same positive factor, so the order holds
+        self.loans["collateral"][: self.used] *= factor
+        self.loans["cdr"][: self.used] *= factor
+        self.sorted_cdr[: self.size] *= factor
@@ -1,11 +1,13 @@
-import json
-import os.path
+import argparse
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
-import requests
-from empiric.core.utils import felt_to_str
 
-ASSET = 'DAI'
+from indexer_crawler import crawl_indexer_events, indexer_session, iter_parts
+from src.felts import felts_to_int
+
 ADDRESSES = {
     'USDC': '0x658251f204f508ce2b728034fc52661022ab35c44d8c82fd99986c08a15ab6b',
     'BTC': '0x40c301fdfcd02b18b2a306c08c83f9997ad7c52a2e55d4137d91c31f011a01',
@@ -14,63 +16,23 @@ ADDRESSES = {
     'USDT': '0x2713eacb5a10248f580084cbee5c9fc265681055e27988e5e43d2862cf2ff9b',
 }
 
-JSON_FILE = f"chainlink-data/{ASSET.lower()}-chainlink-events.json"
-CSV_FILE = f"chainlink-data/{ASSET.lower()}-chainlink-events.csv"
-
-
-def get_events():
-    """If no JSON file in current directory, requests all events from StarkNet Indexer."""
-    if not os.path.isfile(JSON_FILE):
-        chunk_size = 100_000
-        print(
-            f"Requesting all NewTransmission events from StarkNet Indexer. Using chunks of size {chunk_size} This might take a while..."
-        )
-        url = "https://hasura.prod.summary.dev/v1/graphql"
-        i = 0
-        data = None
-        while True:
-            print(f"Fetching chunk {i+1}")
-            # Note that the contract address can't have a leading 0 or the GraphQl query won't find the contract.
-            request_json = {
-                "query": "query chainlink { starknet_goerli_event(limit: "
-                + str(chunk_size)
-                + ", offset: "
-                + str(i * chunk_size)
-                + ', order_by: {id: asc}, where: {name: {_eq: "NewTransmission"}, transmitter_contract: {_eq: "' + ADDRESSES[ASSET] + '"}}) { name arguments { name value } transaction_hash }}'
-            }
-            print(request_json)
-            r = requests.post(url=url, json=request_json)
-            if r.status_code != 200:
-                raise Exception(
-                    f"Query failed to run by returning code of {r.status_code}.\n{request_json}"
-                )
-            new_data = r.json()
-            if "errors" in new_data:
-                print(new_data)
-                raise Exception("Error getting data from starknet indexer")
-            elif data is None:
-                data = new_data
-            elif "data" in data and len(new_data["data"]["starknet_goerli_event"]) > 0:
-                data["data"]["starknet_goerli_event"].extend(
-                    new_data["data"]["starknet_goerli_event"]
-                )
-            else:
-                break
-            i += 1
-
-        with open(JSON_FILE, "w") as data_file:
-            json.dump(data, data_file)
-    else:
-        print(f"Reading in {JSON_FILE}...")
-        with open(JSON_FILE) as data_file:
-            data = json.load(data_file)
-    return data
-
-
-def format_events(data):
-    """Returns a list of Events. Each event's fields are converted to ints."""
-    events = data["data"]["starknet_goerli_event"]
-    formatted_events = [
+# Raw hex pages and the crawl checkpoint of every asset
+EVENTS_DIR = "chainlink-data/chainlink-events-raw"
+# Parquet dataset partitioned by asset: chainlink-data/chainlink-events/asset=DAI/part-000000.parquet
+DATASET_DIR = "chainlink-data/chainlink-events"
+
+
+def events_dir(asset):
+    return os.path.join(EVENTS_DIR, asset.lower())
+
+
+def partition_dir(asset, dataset_dir=DATASET_DIR):
+    return os.path.join(dataset_dir, f"asset={asset}")
+
+
+def flatten_events(events):
+    """Returns one row of hex felts per event: the answer, its observation timestamp and the transaction."""
+    return [
         {
             event["arguments"][1]['name']: event["arguments"][1]["value"],
             event["arguments"][3]['name']: event["arguments"][3]['value'],
@@ -78,31 +40,62 @@ def format_events(data):
         }
         for event in events
     ]
-    print(formatted_events[0])
-    # {'base': {'source': '0x434558', 'publisher': '0x454d5049524943', 'timestamp': '0x63474dcd'}, 'price': '0x1bf143e2b80', 'volume': '0x0', 'pair_id': '0x4254432f555344', 'transaction_hash': '0x636347e557bcb8be4e64bd5d91ef5e571afa4dec90cc2c22f164bb65cfcb44a'}
-    # Flatten the base object
-    # formatted_events = [
-    #     {*event["observations"], *event} for event in formatted_events
-    # ]
-    formatted_events = [
-        {key: int(value, 16) for key, value in event.items() if key != "observations"}
-        for event in formatted_events
-    ]
-    print(formatted_events[-1])
-    return formatted_events
 
 
-def to_csv(formatted_events):
-    print(f"Converting to {CSV_FILE}...")
-    df = pd.DataFrame(formatted_events)
+def get_asset_events(asset, session=None):
+    """Streams every NewTransmission event of one asset's transmitter into its events_dir, resuming an interrupted crawl."""
+    return crawl_indexer_events(
+        "NewTransmission", ADDRESSES[asset], "name arguments { name value } transaction_hash", flatten_events,
+        events_dir(asset), session=session
+    )
+
+
+def get_events(assets=tuple(ADDRESSES)):
+    """Crawls every asset concurrently over one shared connection pool, returns the events on disk per asset.
+
+    The crawls are bound by indexer round trips, so they take about as long as the slowest asset.
+    """
+    print(f"Requesting all NewTransmission events of {', '.join(assets)} from StarkNet Indexer. This might take a while...")
+    # The workers only post through the session, whose urllib3 pool hands each of them its
+    # own connection, so one pool of len(assets) connections serves every crawl
+    with indexer_session(pool_size=len(assets)) as session, ThreadPoolExecutor(max_workers=len(assets)) as executor:
+        futures = {asset: executor.submit(get_asset_events, asset, session) for asset in assets}
+        return {asset: future.result() for asset, future in futures.items()}
+
+
+def format_events(part):
+    """Converts one crawled part's felts to int64 in bulk, so every part has the same schema. Transaction hashes stay hex strings."""
+    df = pd.DataFrame({column: felts_to_int(part[column]) for column in part.columns if column != "transaction_hash"})
+    df["transaction_hash"] = part["transaction_hash"]
     df["value"] = df["answer"] / (10**8)
-    df["observation_timestamp"] = df["observation_timestamp"]
     df["datetime"] = pd.to_datetime(df["observation_timestamp"], unit="s")
-    df.to_csv(CSV_FILE)
-    print(f"Found {df.shape[0]} events.")
+    return df
+
+
+def to_dataset(assets=tuple(ADDRESSES), dataset_dir=DATASET_DIR):
+    """Rewrites the partition of every asset from its crawled parts, one part in memory at a time."""
+    rows = {}
+    for asset in assets:
+        directory = partition_dir(asset, dataset_dir)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        rows[asset] = 0
+        for index, part in enumerate(iter_parts(events_dir(asset))):
+            format_events(part).to_parquet(os.path.join(directory, f"part-{index:06d}.parquet"), index=False)
+            rows[asset] += len(part)
+        print(f"{asset}: {rows[asset]} events in {directory}")
+    return rows
+
+
+def read_events(assets=None, dataset_dir=DATASET_DIR):
+    """Reads the dataset back, only opening the partitions of `assets`. The asset comes back as a categorical column."""
+    filters = [("asset", "in", list(assets))] if assets is not None else None
+    return pd.read_parquet(dataset_dir, filters=filters)
 
 
 if __name__ == "__main__":
-    events = get_events()
-    formatted_events = format_events(events)
-    to_csv(formatted_events)
+    parser = argparse.ArgumentParser(description="Crawl Chainlink NewTransmission events from StarkNet Indexer")
+    parser.add_argument("--assets", nargs="+", choices=list(ADDRESSES), default=list(ADDRESSES))
+    args = parser.parse_args()
+    get_events(args.assets)
+    to_dataset(args.assets)
@@ -1,99 +1,59 @@
-import json
-import os.path
-
+import numpy as np
 import pandas as pd
-import requests
-from empiric.core.utils import felt_to_str
-
-JSON_FILE = "empiric-events.json"
-CSV_FILE = "empiric-events.csv"
 
+from indexer_crawler import crawl_indexer_events, parts_to_csv
+from src.felts import decode_short_strings, felts_to_int
 
-def get_events():
-    """If no JSON file in current directory, requests all events from StarkNet Indexer."""
-    if not os.path.isfile(JSON_FILE):
-        chunk_size = 100_000
-        print(
-            f"Requesting all SubmittedSpotEntry events from StarkNet Indexer. Using chunks of size {chunk_size} This might take a while..."
-        )
-        url = "https://hasura.prod.summary.dev/v1/graphql"
-        i = 0
-        data = None
-        while True:
-            print(f"Fetching chunk {i+1}")
-            # Note that the contract address can't have a leading 0 or the GraphQl query won't find the contract.
-            request_json = {
-                "query": "query empiric { starknet_goerli_event(limit: "
-                + str(chunk_size)
-                + ", offset: "
-                + str(i * chunk_size)
-                + ', order_by: {id: asc}, where: {name: {_eq: "SubmittedSpotEntry"}, transmitter_contract: {_eq: "0x446812bac98c08190dee8967180f4e3cdcd1db9373ca269904acb17f67f7093"}}) { name arguments { value } transaction_hash }}'
-            }
-            print(request_json)
-            r = requests.post(url=url, json=request_json)
-            if r.status_code != 200:
-                raise Exception(
-                    f"Query failed to run by returning code of {r.status_code}.\n{request_json}"
-                )
-            new_data = r.json()
-            if "errors" in new_data:
-                print(new_data)
-                raise Exception("Error getting data from starknet indexer")
-            elif data is None:
-                data = new_data
-            elif "data" in data and len(new_data["data"]["starknet_goerli_event"]) > 0:
-                data["data"]["starknet_goerli_event"].extend(
-                    new_data["data"]["starknet_goerli_event"]
-                )
-            else:
-                break
-            i += 1
-
-        with open(JSON_FILE, "w") as data_file:
-            json.dump(data, data_file)
-    else:
-        print(f"Reading in {JSON_FILE}...")
-        with open(JSON_FILE) as data_file:
-            data = json.load(data_file)
-    return data
+EMPIRIC_CONTRACT_ADDRESS = "0x446812bac98c08190dee8967180f4e3cdcd1db9373ca269904acb17f67f7093"
+EVENTS_DIR = "empiric-events"
+CSV_FILE = "empiric-events.csv"
+INT64_COLUMNS = {"timestamp"}
+SHORT_STRING_COLUMNS = {"source", "publisher"}
 
 
-def format_events(data):
-    """Returns a list of Events. Each event's fields are converted to ints."""
-    events = data["data"]["starknet_goerli_event"]
-    formatted_events = [
+def flatten_events(events):
+    """Returns one row of hex felts per event."""
+    # {'base': {'source': '0x434558', 'publisher': '0x454d5049524943', 'timestamp': '0x63474dcd'}, 'price': '0x1bf143e2b80', 'volume': '0x0', 'pair_id': '0x4254432f555344', 'transaction_hash': '0x636347e557bcb8be4e64bd5d91ef5e571afa4dec90cc2c22f164bb65cfcb44a'}
+    # Flatten the base object
+    return [
         {
-            **event["arguments"][0]["value"],
+            **event["arguments"][0]["value"]["base"],
+            **{key: value for key, value in event["arguments"][0]["value"].items() if key != "base"},
             "transaction_hash": event["transaction_hash"],
         }
         for event in events
     ]
-    # {'base': {'source': '0x434558', 'publisher': '0x454d5049524943', 'timestamp': '0x63474dcd'}, 'price': '0x1bf143e2b80', 'volume': '0x0', 'pair_id': '0x4254432f555344', 'transaction_hash': '0x636347e557bcb8be4e64bd5d91ef5e571afa4dec90cc2c22f164bb65cfcb44a'}
-    # Flatten the base object
-    formatted_events = [
-        {**event["base"], **event} for event in formatted_events
-    ]
-    formatted_events = [
-        {key: int(value, 16) for key, value in event.items() if key != "base"}
-        for event in formatted_events
-    ]
-    print(formatted_events[0])
-    return formatted_events
 
 
-def to_csv(formatted_events):
-    print(f"Converting to {CSV_FILE}...")
-    df = pd.DataFrame(formatted_events)
-    df["key"] = df["pair_id"].apply(felt_to_str)
-    df["value"] = df["price"] / (10**8)
+def get_events():
+    """Streams every SubmittedSpotEntry event from StarkNet Indexer into EVENTS_DIR, resuming an interrupted crawl."""
+    print(f"Requesting all SubmittedSpotEntry events from StarkNet Indexer into {EVENTS_DIR}/. This might take a while...")
+    return crawl_indexer_events(
+        "SubmittedSpotEntry", EMPIRIC_CONTRACT_ADDRESS, "name arguments { value } transaction_hash", flatten_events, EVENTS_DIR
+    )
+
+
+def format_events(part):
+    """Converts one crawled part's felts to ints, short strings are decoded once per distinct value."""
+    # Every column keeps one dtype across parts: timestamps fit in int64 and are converted
+    # in bulk, prices, volumes, pair ids and hashes can be wider and stay Python ints
+    df = pd.DataFrame({
+        column: decode_short_strings(part[column]) if column in SHORT_STRING_COLUMNS
+        else felts_to_int(part[column], dtype=np.int64 if column in INT64_COLUMNS else object)
+        for column in part.columns
+    })
+    df["key"] = decode_short_strings(part["pair_id"])
+    df["value"] = df["price"].astype(np.float64) / (10**8)
     df["datetime"] = pd.to_datetime(df["timestamp"], unit="s")
-    df["publisher"] = df["publisher"].apply(felt_to_str)
-    df["source"] = df["source"].apply(felt_to_str)
-    df.to_csv(CSV_FILE)
-    print(f"Found {df.shape[0]} events.")
+    return df
+
+
+def to_csv():
+    print(f"Converting to {CSV_FILE}...")
+    rows = parts_to_csv(EVENTS_DIR, CSV_FILE, format_events)
+    print(f"Found {rows} events.")
 
 
 if __name__ == "__main__":
-    events = get_events()
-    formatted_events = format_events(events)
-    to_csv(formatted_events)
+    get_events()
+    to_csv()
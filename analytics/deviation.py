@@ -1,21 +1,17 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-import glob
-
-
-def load_and_concatenate_parquets(parquet_directory):
-    # Glob pattern to match all parquet files in the directory
-    files = glob.glob(f"{parquet_directory}/*.parquet")
 
-    # Load and concatenate all parquet files into a single DataFrame
-    df = pd.concat([pd.read_parquet(file) for file in files], ignore_index=True)
-    return df
+from historical_dataset import HISTORICAL_PARQUET_DIRECTORY, read_historical
+from src.instrumentation import METRICS, export_metrics
 
 
-def filter_eth_usd_data(df):
-    # Assuming 'ETH/USD' is the pair_id for Ethereum to USD
-    filtered_df = df[df["pair_id"] == "ETH/USD"]
-    return filtered_df
+def load_eth_usd_data(parquet_directory):
+    # Only the ETH/USD rows and the columns used below are read from the archive
+    return read_historical(parquet_directory, pairs=["ETH/USD"], columns=["pair_id", "price", "timestamp"])
 
 
 def clean_and_format_data(df):
@@ -29,7 +25,7 @@ def clean_and_format_data(df):
 
 def aggregate_price_median(df):
     # Resample to 1-hour intervals and calculate median of 'price'
-    df_resampled = df.resample("1H").agg({"price": "median"})
+    df_resampled = df.resample("1h").agg({"price": "median"})
     return df_resampled
 
 
@@ -43,22 +39,6 @@ def plot_eth_usd_price(df):
     plt.show()
 
 
-# Load, filter, clean and format data
-parquet_directory = "../data/historical_parquet"  # Update this path
-df = load_and_concatenate_parquets(parquet_directory)
-filtered_df = filter_eth_usd_data(df)
-clean_df = clean_and_format_data(filtered_df)
-
-# Aggregate prices by 1-hour intervals
-hourly_median_df = aggregate_price_median(clean_df)
-
-
-def calculate_percentage_change(df):
-    # Calculate the percentage change in price
-    df["price_change_pct"] = df["price"].pct_change() * 100
-    return df
-
-
 def calculate_percentage_change(df):
     # Calculate the percentage change in price
     df["price_change_pct"] = df["price"].pct_change() * 100
@@ -74,26 +54,6 @@ def count_deviations(df, threshold):
     return deviations, upward_deviations, downward_deviations
 
 
-# Calculate percentage change in price
-hourly_median_df = calculate_percentage_change(hourly_median_df)
-
-# Count 25bps deviations
-deviations_25bps, upper_deviations_25bps, lower_deviations_25bps = count_deviations(
-    hourly_median_df, 0.25
-)
-print(f"Total 25bps deviations: {len(deviations_25bps)}")
-print(f" - Upward 25bps deviations: {len(upper_deviations_25bps)}")
-print(f" - Downward 25bps deviations: {len(lower_deviations_25bps)}")
-
-# Count 50bps deviations
-deviations_50bps, upper_deviations_50bps, lower_deviations_50bps = count_deviations(
-    hourly_median_df, 0.50
-)
-print(f"Total 50bps deviations: {len(deviations_50bps)}")
-print(f" - Upward 50bps deviations: {len(upper_deviations_50bps)}")
-print(f" - Downward 50bps deviations: {len(lower_deviations_50bps)}")
-
-
 def calculate_daily_deviations(df, threshold):
     # First, identify all deviations that exceed the threshold
     deviations = df[abs(df["price_change_pct"]) >= threshold]
@@ -102,19 +62,115 @@ def calculate_daily_deviations(df, threshold):
     return daily_deviations
 
 
-# Calculate daily deviations for both thresholds
-daily_deviations_25bps = calculate_daily_deviations(hourly_median_df, 0.25)
-daily_deviations_50bps = calculate_daily_deviations(hourly_median_df, 0.50)
-
-# Calculate average number of deviations per day
-average_deviations_per_day_25bps = daily_deviations_25bps["price_change_pct"].mean()
-average_deviations_per_day_50bps = daily_deviations_50bps["price_change_pct"].mean()
-
-print(f"Average 25bps deviations per day: {average_deviations_per_day_25bps}")
-print(f"Average 50bps deviations per day: {average_deviations_per_day_50bps}")
-
-
-# Plot the aggregated data
-plot_eth_usd_price(
-    hourly_median_df.reset_index()
-)  # Reset index to use 'timestamp' as a column again for plotting
+def hourly_price_changes(df, freq="1h"):
+    # Median price per pair and interval, then the interval-over-interval change within each pair.
+    # Empty intervals carry the last median forward, like pct_change's default padding.
+    hourly = df.groupby(["pair_id", pd.Grouper(key="timestamp", freq=freq)], observed=True)["price"].median()
+    hourly = hourly.unstack("pair_id").asfreq(freq).ffill()
+    changes = hourly.pct_change(fill_method=None) * 100
+    return changes.stack().rename("price_change_pct").reset_index()
+
+
+def count_all_deviations(changes, thresholds):
+    """Upward, downward and average daily deviation counts for every pair and threshold at once.
+
+    `changes` holds pair_id, timestamp and price_change_pct rows, every threshold is compared
+    in the same broadcast and all counts come out of one groupby.
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    change = changes["price_change_pct"].to_numpy()
+    hits = np.abs(change)[:, None] >= thresholds[None, :]
+    upward = hits & (change > 0)[:, None]
+    downward = hits & (change < 0)[:, None]
+    daily = pd.DataFrame(np.hstack([hits, upward, downward]).astype(np.int64)).groupby(
+        [changes["pair_id"].to_numpy(), changes["timestamp"].dt.floor("D").to_numpy()]
+    ).sum()
+    totals = daily.groupby(level=0).sum()
+    counts = totals.to_numpy().reshape(len(totals), 3, len(thresholds))
+    average_per_day = daily.groupby(level=0).mean().to_numpy()[:, : len(thresholds)]
+    return pd.DataFrame(
+        {
+            "total": counts[:, 0].ravel(),
+            "upward": counts[:, 1].ravel(),
+            "downward": counts[:, 2].ravel(),
+            "average_per_day": average_per_day.ravel(),
+        },
+        index=pd.MultiIndex.from_product([totals.index, thresholds], names=["pair_id", "threshold"]),
+    )
+
+
+def pair_deviation_report(pair, thresholds, parquet_directory=HISTORICAL_PARQUET_DIRECTORY, freq="1h"):
+    df = clean_and_format_data(read_historical(parquet_directory, pairs=[pair])).reset_index()
+    return count_all_deviations(hourly_price_changes(df, freq), thresholds)
+
+
+def deviation_report(thresholds, pairs=None, parquet_directory=HISTORICAL_PARQUET_DIRECTORY, freq="1h", processes=None):
+    """Deviation counts for every pair of the archive (or `pairs`) and every threshold.
+
+    Pairs are independent, so each one is read with its own pushed-down slice and
+    processed on a separate core.
+    """
+    if pairs is None:
+        pairs = read_historical(parquet_directory, columns=["pair_id"])["pair_id"].unique().tolist()
+    with METRICS.stage("deviation.report"), ProcessPoolExecutor(max_workers=processes) as executor:
+        reports = executor.map(
+            partial(pair_deviation_report, thresholds=thresholds, parquet_directory=parquet_directory, freq=freq),
+            sorted(pairs),
+        )
+        report = pd.concat(list(reports))
+    METRICS.increment("deviation_pairs_total", len(pairs))
+    return report
+
+
+def main():
+    # Load, filter, clean and format data
+    parquet_directory = "../data/historical_parquet"  # Update this path
+    filtered_df = load_eth_usd_data(parquet_directory)
+    clean_df = clean_and_format_data(filtered_df)
+
+    # Aggregate prices by 1-hour intervals
+    hourly_median_df = aggregate_price_median(clean_df)
+
+    # Calculate percentage change in price
+    hourly_median_df = calculate_percentage_change(hourly_median_df)
+
+    # Count 25bps deviations
+    deviations_25bps, upper_deviations_25bps, lower_deviations_25bps = count_deviations(
+        hourly_median_df, 0.25
+    )
+    print(f"Total 25bps deviations: {len(deviations_25bps)}")
+    print(f" - Upward 25bps deviations: {len(upper_deviations_25bps)}")
+    print(f" - Downward 25bps deviations: {len(lower_deviations_25bps)}")
+
+    # Count 50bps deviations
+    deviations_50bps, upper_deviations_50bps, lower_deviations_50bps = count_deviations(
+        hourly_median_df, 0.50
+    )
+    print(f"Total 50bps deviations: {len(deviations_50bps)}")
+    print(f" - Upward 50bps deviations: {len(upper_deviations_50bps)}")
+    print(f" - Downward 50bps deviations: {len(lower_deviations_50bps)}")
+
+    # Calculate daily deviations for both thresholds
+    daily_deviations_25bps = calculate_daily_deviations(hourly_median_df, 0.25)
+    daily_deviations_50bps = calculate_daily_deviations(hourly_median_df, 0.50)
+
+    # Calculate average number of deviations per day
+    average_deviations_per_day_25bps = daily_deviations_25bps["price_change_pct"].mean()
+    average_deviations_per_day_50bps = daily_deviations_50bps["price_change_pct"].mean()
+
+    print(f"Average 25bps deviations per day: {average_deviations_per_day_25bps}")
+    print(f"Average 50bps deviations per day: {average_deviations_per_day_50bps}")
+
+    # Same thresholds for every pair of the archive, in one pass per pair
+    print(deviation_report([0.25, 0.50], parquet_directory=parquet_directory))
+
+    export_metrics("deviation")
+
+    # Plot the aggregated data
+    plot_eth_usd_price(
+        hourly_median_df.reset_index()
+    )  # Reset index to use 'timestamp' as a column again for plotting
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+# The analytics scripts run from this directory, src/ lives one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.instrumentation import METRICS  # noqa: E402
+from src.ticks import TickArray  # noqa: E402
+
+HISTORICAL_PARQUET_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "data", "historical_parquet")
+DICTIONARY_COLUMNS = ["network", "pair_id", "publisher", "source"]
+# Archive prices are 8 decimal fixed point
+ARCHIVE_DECIMALS = 8
+
+
+def list_partitions(parquet_directory=HISTORICAL_PARQUET_DIRECTORY, start_block=None, end_block=None):
+    """Archive files sorted by block range, skipping the ones outside [start_block, end_block].
+
+    File names carry the block range they hold: 0000500006_0000505013.parquet
+    """
+    partitions = []
+    for name in sorted(os.listdir(parquet_directory)):
+        if not name.endswith(".parquet"):
+            continue
+        first_block, last_block = [int(block) for block in name[: -len(".parquet")].split("_")]
+        if start_block is not None and last_block < start_block:
+            continue
+        if end_block is not None and first_block > end_block:
+            continue
+        partitions.append(os.path.join(parquet_directory, name))
+    return partitions
+
+
+def to_archive_timestamp(value):
+    # The archive stores timestamps as fixed width ISO strings (2024-01-09T04:01:10.000Z),
+    # which compare lexicographically in time order
+    if value.tzinfo is not None:
+        value = value.tz_convert("UTC")
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def historical_filter(pairs=None, start=None, end=None, start_block=None, end_block=None):
+    conditions = []
+    if pairs is not None:
+        conditions.append(ds.field("pair_id").isin(list(pairs)))
+    if start is not None:
+        conditions.append(ds.field("timestamp") >= to_archive_timestamp(pd.Timestamp(start)))
+    if end is not None:
+        conditions.append(ds.field("timestamp") < to_archive_timestamp(pd.Timestamp(end)))
+    if start_block is not None:
+        conditions.append(ds.field("block_number") >= start_block)
+    if end_block is not None:
+        conditions.append(ds.field("block_number") <= end_block)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def historical_dataset(parquet_directory=HISTORICAL_PARQUET_DIRECTORY, start_block=None, end_block=None):
+    file_format = ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=DICTIONARY_COLUMNS))
+    return ds.dataset(list_partitions(parquet_directory, start_block, end_block), format=file_format)
+
+
+def read_historical(
+    parquet_directory=HISTORICAL_PARQUET_DIRECTORY,
+    pairs=None,
+    start=None,
+    end=None,
+    start_block=None,
+    end_block=None,
+    columns=("pair_id", "price", "timestamp"),
+):
+    """Reads a slice of the historical archive.
+
+    Files outside the block range are never opened, pair/time/block predicates are
+    pushed into the Parquet scan and only `columns` are decoded, so memory follows
+    the size of the slice. Low cardinality columns come back as categoricals.
+    """
+    if not list_partitions(parquet_directory, start_block, end_block):
+        return pd.DataFrame(columns=list(columns) if columns is not None else None)
+    dataset = historical_dataset(parquet_directory, start_block, end_block)
+    with METRICS.stage("historical.read"):
+        table = dataset.to_table(
+            columns=list(columns) if columns is not None else None,
+            filter=historical_filter(pairs, start, end, start_block, end_block),
+        )
+    METRICS.increment("historical_files_read_total", len(dataset.files))
+    METRICS.increment("historical_rows_read_total", table.num_rows)
+    METRICS.increment("historical_bytes_decoded_total", table.nbytes)
+    return table.to_pandas()
+
+
+def epoch_seconds(times):
+    return ((pd.to_datetime(times, utc=True) - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).to_numpy(dtype="int64")
+
+
+def to_tick_array(pairs, values, timestamps, sources=None, publishers=None):
+    """TickArray of archive prices. Labels are kept dictionary encoded as read, through their categoricals."""
+    pairs = pd.Categorical(pairs)
+    labels = {}
+    for name, column in [("source", sources), ("publisher", publishers)]:
+        if column is not None:
+            column = pd.Categorical(column)
+            labels[f"{name}_codes"], labels[f"{name}s"] = column.codes, column.categories.to_numpy(dtype=object)
+    return TickArray(
+        pairs.codes, pairs.categories.to_numpy(dtype=object), [ARCHIVE_DECIMALS] * len(pairs.categories),
+        np.rint(np.asarray(values, dtype=np.float64)), timestamps, **labels,
+    )
+
+
+def read_ticks(parquet_directory=HISTORICAL_PARQUET_DIRECTORY, pairs=None, start=None, end=None, start_block=None, end_block=None):
+    """Slice of the archive as a TickArray: pair, source and publisher, fixed point prices and entry times in epoch seconds."""
+    df = read_historical(
+        parquet_directory, pairs=pairs, start=start, end=end, start_block=start_block, end_block=end_block,
+        columns=["pair_id", "publisher", "source", "price", "timestamp"],
+    )
+    return to_tick_array(df["pair_id"], df["price"], epoch_seconds(df["timestamp"]), df["source"], df["publisher"])
@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.instrumentation import METRICS  # noqa: E402
+
+INDEXER_URL = "https://hasura.prod.summary.dev/v1/graphql"
+PAGE_SIZE = 10_000
+MAX_RETRIES = 5
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def indexer_session(pool_size=1):
+    """Session whose connection pool keeps `pool_size` connections to the indexer open, one per concurrent crawl."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
+
+
+def event_query(event_name, contract_address, fields, after_id, limit):
+    # Keyset pagination: every page starts right after the last id seen, so the indexer
+    # seeks on its id index instead of skipping `offset` rows.
+    # Note that the contract address can't have a leading 0 or the GraphQl query won't find the contract.
+    after = "" if after_id is None else f"id: {{_gt: {json.dumps(after_id)}}}, "
+    return {
+        "query": f"query events {{ starknet_goerli_event(limit: {limit}, order_by: {{id: asc}}, "
+        f'where: {{{after}name: {{_eq: "{event_name}"}}, transmitter_contract: {{_eq: "{contract_address}"}}}}) '
+        f"{{ id {fields} }}}}"
+    }
+
+
+def fetch_page(session, request_json, url=INDEXER_URL, max_retries=MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        try:
+            with METRICS.timer("indexer_request_seconds"):
+                r = session.post(url=url, json=request_json, timeout=120)
+            if r.status_code == 200:
+                page = r.json()
+                if "errors" in page:
+                    raise Exception(f"Error getting data from starknet indexer: {page['errors']}")
+                return page["data"]["starknet_goerli_event"]
+            error = f"Query failed to run by returning code of {r.status_code}"
+        except requests.RequestException as e:
+            error = repr(e)
+        if attempt < max_retries:
+            METRICS.increment("indexer_request_retries_total")
+            time.sleep(2**attempt)
+    raise Exception(f"{error}\n{request_json}")
+
+
+def read_checkpoint(output_dir):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.isfile(path):
+        return {"last_id": None, "parts": 0, "events": 0}
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def write_checkpoint(output_dir, checkpoint):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    with open(f"{path}.tmp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(f"{path}.tmp", path)
+
+
+def part_path(output_dir, part):
+    return os.path.join(output_dir, f"part-{part:06d}.csv")
+
+
+def crawl_indexer_events(event_name, contract_address, fields, format_page, output_dir, page_size=PAGE_SIZE, session=None):
+    """Streams every `event_name` event of `contract_address` from the indexer to `output_dir`.
+
+    Each page is flattened by `format_page` (list of events -> list of rows) and written to
+    its own part-NNNNNN.csv before the checkpoint moves past its last id, so an interrupted
+    crawl resumes from the last complete page and only one page is ever held in memory.
+    Concurrent crawls can share one `session` (see indexer_session). Returns the number of events on disk.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = read_checkpoint(output_dir)
+    if checkpoint["last_id"] is not None:
+        print(f"{output_dir}: resuming after id {checkpoint['last_id']} ({checkpoint['events']} events in {checkpoint['parts']} parts)")
+    owns_session = session is None
+    session = indexer_session() if owns_session else session
+    try:
+        while True:
+            print(f"{output_dir}: fetching page {checkpoint['parts'] + 1}")
+            events = fetch_page(session, event_query(event_name, contract_address, fields, checkpoint["last_id"], page_size))
+            if not events:
+                break
+            path = part_path(output_dir, checkpoint["parts"])
+            pd.DataFrame(format_page(events)).to_csv(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+            checkpoint = {
+                "last_id": events[-1]["id"],
+                "parts": checkpoint["parts"] + 1,
+                "events": checkpoint["events"] + len(events),
+            }
+            write_checkpoint(output_dir, checkpoint)
+            METRICS.increment("indexer_events_total", len(events), event=event_name)
+            if len(events) < page_size:
+                break
+    finally:
+        if owns_session:
+            session.close()
+    return checkpoint["events"]
+
+
+def iter_parts(output_dir):
+    """Yields the crawled parts one DataFrame at a time, in id order, felts kept as hex strings."""
+    for part in range(read_checkpoint(output_dir)["parts"]):
+        yield pd.read_csv(part_path(output_dir, part), dtype=str)
+
+
+def parts_to_csv(output_dir, csv_file, transform):
+    """Concatenates the transformed parts into `csv_file`, one part in memory at a time."""
+    rows = 0
+    for part in iter_parts(output_dir):
+        df = transform(part)
+        df.index += rows
+        df.to_csv(f"{csv_file}.tmp", mode="a" if rows else "w", header=rows == 0)
+        rows += len(df)
+    if rows:
+        os.replace(f"{csv_file}.tmp", csv_file)
+    return rows
@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import heapq
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# The analytics scripts run from this directory, src/ lives one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.instrumentation import METRICS, export_metrics  # noqa: E402
+
+# Scheduler sources that publish reference prices, every other source is an oracle
+REFERENCE_SOURCES = {"coinmarketcap", "kaiko"}
+DEFAULT_THRESHOLDS = {
+    # One update against the latest reference price
+    "deviation_bps": 100,
+    # Mean absolute deviation over the feed's window
+    "rolling_deviation_bps": 50,
+    # Time between the value's timestamp and its arrival
+    "latency_s": 60,
+    # Time since the feed's last value
+    "staleness_s": 600,
+}
+
+
+class RingBuffer:
+    """
+    Fixed size window of floats with running sum and sum of squares, so pushing a value
+    and reading the mean or standard deviation are O(1) (amortized)
+    """
+
+    def __init__(self, capacity):
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+        self.sum = 0.0
+        self.sum_squares = 0.0
+
+    def push(self, value):
+        if self.count == self.capacity:
+            evicted = float(self.values[self.head])
+            self.sum -= evicted
+            self.sum_squares -= evicted * evicted
+        else:
+            self.count += 1
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.head == 0:
+            # Resummed once per lap so rounding errors of the running sums don't accumulate
+            self.sum = float(self.values[:self.count].sum())
+            self.sum_squares = float(np.dot(self.values[:self.count], self.values[:self.count]))
+        else:
+            self.sum += value
+            self.sum_squares += value * value
+
+    def last(self):
+        return float(self.values[(self.head - 1) % self.capacity]) if self.count else math.nan
+
+    def mean(self):
+        return self.sum / self.count if self.count else math.nan
+
+    def std(self):
+        if not self.count:
+            return math.nan
+        mean = self.sum / self.count
+        return math.sqrt(max(self.sum_squares / self.count - mean * mean, 0.0))
+
+    def window(self):
+        """Values oldest first"""
+        return np.roll(self.values, -self.head)[self.capacity - self.count:]
+
+
+class FeedState:
+    """
+    Rolling state of one oracle feed (source, publisher, pair)
+    """
+
+    def __init__(self, window):
+        self.deviation_bps = RingBuffer(window)
+        self.abs_deviation_bps = RingBuffer(window)
+        self.latency_s = RingBuffer(window)
+        self.interval_s = RingBuffer(window)
+        self.value = math.nan
+        self.timestamp = None
+        self.received_at = None
+
+
+class OracleMonitor:
+    """
+    Streaming oracle quality monitor.
+
+    Consumes oracle updates and reference prices one event at a time. An event is a dict
+    with source, pair, value, timestamp (epoch seconds the value is for) and optionally
+    publisher, received_at (epoch seconds it arrived, defaults to timestamp) and
+    reference (True for reference prices). Each oracle update is compared against the
+    latest reference price of its pair and pushed into its feed's ring buffers, so the
+    work per event does not depend on how many events or feeds came before.
+
+    Thresholds are checked on the update that breaches them. An alert fires once when
+    a check starts failing and resolves when it passes again. Staleness has no update
+    to trigger it, so `check_staleness` sweeps every feed (run periodically by `run`).
+    """
+
+    def __init__(self, thresholds=None, window=100, reference_max_age=300, handlers=None):
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.window = window
+        self.reference_max_age = reference_max_age
+        self.handlers = handlers if handlers is not None else [print_alert]
+        self.references = {}
+        self.feeds = {}
+        self.active = {}
+        self.alerts = []
+
+    def process(self, event):
+        if event.get("reference", event["source"] in REFERENCE_SOURCES):
+            self.references[event["pair"]] = (event["value"], event["timestamp"])
+            METRICS.increment("monitor_events_total", kind="reference")
+            return
+        METRICS.increment("monitor_events_total", kind="oracle")
+        key = (event["source"], event.get("publisher"), event["pair"])
+        feed = self.feeds.get(key)
+        if feed is None:
+            feed = self.feeds[key] = FeedState(self.window)
+        timestamp = event["timestamp"]
+        received_at = event.get("received_at", timestamp)
+        if feed.timestamp is not None:
+            feed.interval_s.push(timestamp - feed.timestamp)
+        feed.value, feed.timestamp, feed.received_at = event["value"], timestamp, received_at
+
+        latency = received_at - timestamp
+        feed.latency_s.push(latency)
+        self.check(key, "latency_s", latency, received_at)
+
+        reference = self.references.get(event["pair"])
+        if reference is not None and abs(timestamp - reference[1]) <= self.reference_max_age:
+            deviation = (event["value"] / reference[0] - 1) * 10**4
+            feed.deviation_bps.push(deviation)
+            feed.abs_deviation_bps.push(abs(deviation))
+            self.check(key, "deviation_bps", abs(deviation), received_at)
+            self.check(key, "rolling_deviation_bps", feed.abs_deviation_bps.mean(), received_at)
+        # A fresh update ends a staleness alert
+        self.check(key, "staleness_s", 0.0, received_at)
+
+    def check_staleness(self, now=None):
+        now = time.time() if now is None else now
+        for key, feed in self.feeds.items():
+            staleness = now - feed.timestamp
+            METRICS.set_gauge("monitor_staleness_seconds", staleness, source=key[0], publisher=key[1], pair=key[2])
+            self.check(key, "staleness_s", staleness, now)
+
+    def check(self, key, metric, value, at):
+        threshold = self.thresholds.get(metric)
+        if threshold is None:
+            return
+        breached = value > threshold
+        if breached == ((key, metric) in self.active):
+            return
+        alert = {
+            "status": "firing" if breached else "resolved", "metric": metric, "value": value, "threshold": threshold,
+            "source": key[0], "publisher": key[1], "pair": key[2], "at": at,
+        }
+        if breached:
+            self.active[(key, metric)] = alert
+        else:
+            del self.active[(key, metric)]
+        self.alerts.append(alert)
+        METRICS.increment("monitor_alerts_total", status=alert["status"], metric=metric, source=key[0], pair=key[2])
+        for handler in self.handlers:
+            handler(alert)
+
+    def summary(self):
+        """Current rolling figures of every feed"""
+        return [
+            {
+                "source": source, "publisher": publisher, "pair": pair, "value": feed.value,
+                "mean_deviation_bps": feed.deviation_bps.mean(), "std_deviation_bps": feed.deviation_bps.std(),
+                "mean_abs_deviation_bps": feed.abs_deviation_bps.mean(), "mean_latency_s": feed.latency_s.mean(),
+                "mean_interval_s": feed.interval_s.mean(), "last_timestamp": feed.timestamp,
+            }
+            for (source, publisher, pair), feed in self.feeds.items()
+        ]
+
+    async def run(self, queue, staleness_interval=1.0, clock=time.time):
+        """Processes events from `queue` until it yields None, sweeping staleness every `staleness_interval` seconds."""
+        async def sweep():
+            while True:
+                await asyncio.sleep(staleness_interval)
+                self.check_staleness(clock())
+
+        sweeper = asyncio.ensure_future(sweep())
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                self.process(event)
+        finally:
+            sweeper.cancel()
+
+
+def print_alert(alert):
+    publisher = f" {alert['publisher']}" if alert["publisher"] else ""
+    print(
+        f"[{alert['status'].upper()}] {alert['source']}{publisher} {alert['pair']}: "
+        f"{alert['metric']} {alert['value']:.2f} (threshold {alert['threshold']}) at {alert['at']:.3f}"
+    )
+
+
+def tick_events(ticks, reference=False, received_at=None):
+    """Events of a loader's TickArray (Empiric, Chainlink or Kaiko), for replaying history through the monitor."""
+    seconds = ticks.timestamps / (1000 if ticks.unit == "ms" else 1)
+    pairs, prices = ticks.labels("pairs"), ticks.prices()
+    sources = ticks.labels("sources") if len(ticks.sources) else [None] * len(ticks)
+    publishers = ticks.labels("publishers") if len(ticks.publishers) else [None] * len(ticks)
+    for index in np.argsort(seconds, kind="stable"):
+        yield {
+            "source": sources[index], "publisher": publishers[index], "pair": pairs[index],
+            "value": float(prices[index]), "timestamp": float(seconds[index]),
+            "received_at": float(seconds[index] if received_at is None else received_at[index]), "reference": reference,
+        }
+
+
+def replay(*streams):
+    """Merges event streams in arrival order"""
+    return heapq.merge(*streams, key=lambda event: event.get("received_at", event["timestamp"]))
+
+
+class MonitorSink:
+    """
+    Sink for analytics/scheduler.py that feeds every polled row to the monitor on its way to `sink`.
+    The scheduler's sources key rows by pair (ETH/USD), so reference and oracle rows meet.
+    Staleness is swept at the arrival time of every polled batch.
+    """
+
+    def __init__(self, monitor, sink=None):
+        self.monitor = monitor
+        self.sink = sink
+
+    def append(self, rows):
+        for row in rows:
+            self.monitor.process({
+                "source": row["source"], "pair": row["asset"], "value": row["value"],
+                "timestamp": row["timestamp"] if not math.isnan(row["timestamp"]) else row["received_at"] / 10**6,
+                "received_at": row["received_at"] / 10**6,
+            })
+        if rows:
+            self.monitor.check_staleness(max(row["received_at"] for row in rows) / 10**6)
+        return self.sink.append(rows) if self.sink is not None else False
+
+    def drain(self):
+        return self.sink.drain() if self.sink is not None else []
+
+    def flush(self, rows=None):
+        if self.sink is not None:
+            self.sink.flush(rows)
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+
+
+async def synthetic_emitter(queue, pairs=("ETH/USD", "BTC/USD"), sources=("empiric", "chainlink", "stork"),
+                            duration=30.0, rate=10.0, speed=1.0, seed=0):
+    """
+    Local stand-in for the live streams: a random walk reference per pair at `rate` updates
+    per second, and oracle updates that track it with noise and delay. Halfway through, the
+    first source starts quoting the first pair 2% off and the last source stops updating
+    the last pair, so every alert kind fires. `speed` > 1 replays faster than real time.
+    Puts None on the queue when done.
+    """
+    rng = np.random.default_rng(seed)
+    prices = {pair: 10.0 ** rng.uniform(0, 4.5) for pair in pairs}
+    start = time.time()
+    steps = int(duration * rate)
+    for step in range(steps):
+        now = start + step / rate
+        await asyncio.sleep(max((now - start) / speed - (time.time() - start), 0))
+        for pair in pairs:
+            prices[pair] *= math.exp(rng.normal(0, 0.0005))
+            await queue.put({"source": "coinmarketcap", "pair": pair, "value": prices[pair], "timestamp": now, "received_at": now, "reference": True})
+            for source in sources:
+                if step > steps // 2 and source == sources[-1] and pair == pairs[-1]:
+                    continue
+                skew = 0.02 if step > steps // 2 and source == sources[0] and pair == pairs[0] else 0.0
+                delay = float(rng.exponential(0.5))
+                await queue.put({
+                    "source": source, "pair": pair, "value": prices[pair] * (1 + skew + rng.normal(0, 0.0002)),
+                    "timestamp": now - delay, "received_at": now,
+                })
+    await queue.put(None)
+
+
+async def run_synthetic(duration, speed, thresholds=None):
+    queue = asyncio.Queue(maxsize=10_000)
+    monitor = OracleMonitor(thresholds)
+    clock_start = time.time()
+
+    def clock():
+        # Staleness follows the emitter's simulated time when it runs faster than real time
+        return clock_start + (time.time() - clock_start) * speed
+
+    await asyncio.gather(
+        synthetic_emitter(queue, duration=duration, speed=speed),
+        monitor.run(queue, staleness_interval=0.1, clock=clock),
+    )
+    return monitor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor oracle deviation, latency and staleness against reference prices")
+    parser.add_argument("--duration", type=float, default=60, help="Simulated seconds of synthetic updates")
+    parser.add_argument("--speed", type=float, default=10, help="Simulated seconds per real second")
+    parser.add_argument("--staleness", type=float, default=5, help="Staleness threshold in seconds")
+    args = parser.parse_args()
+    monitor = asyncio.run(run_synthetic(args.duration, args.speed, {"staleness_s": args.staleness, "latency_s": 3}))
+    print(pd.DataFrame(monitor.summary()).to_string())
+    export_metrics("monitor")
@@ -0,0 +1,120 @@
+import os
+
+import pandas as pd
+
+from historical_dataset import HISTORICAL_PARQUET_DIRECTORY, read_historical
+from src.instrumentation import METRICS, export_metrics
+
+# Written by crawl_events.py
+EVENTS_CSV_FILE = "empiric-events.csv"
+
+
+def load_csv_entries(path=EVENTS_CSV_FILE):
+    # crawl_events.py output: pair string in `key`, price in units in `value`, epoch seconds in `timestamp`.
+    # Rows are in event order, which stands in for arrival time.
+    df = pd.read_csv(path, usecols=["key", "publisher", "source", "timestamp", "value"])
+    return pd.DataFrame({
+        "pair": df["key"].astype("category"),
+        "publisher": df["publisher"].astype("category"),
+        "source": df["source"].astype("category"),
+        "time": pd.to_datetime(df["timestamp"], unit="s", utc=True),
+        "value": df["value"].astype(float),
+        "arrival": pd.NaT,
+    })
+
+
+def load_archive_entries(parquet_directory=HISTORICAL_PARQUET_DIRECTORY, pairs=None, start=None, end=None):
+    # Archive entries carry the block they landed in, so arrival is the block time
+    df = read_historical(
+        parquet_directory, pairs=pairs, start=start, end=end,
+        columns=["pair_id", "publisher", "source", "price", "timestamp", "block_timestamp"],
+    )
+    return pd.DataFrame({
+        "pair": df["pair_id"].astype("category"),
+        "publisher": df["publisher"].astype("category"),
+        "source": df["source"].astype("category"),
+        "time": pd.to_datetime(df["timestamp"], utc=True),
+        "value": df["price"].astype(float) / 10**8,
+        "arrival": pd.to_datetime(df["block_timestamp"], utc=True),
+    })
+
+
+def add_entry_metrics(entries, window="5min"):
+    """Per-entry deviation from the pair's trailing `window` median, staleness and update interval.
+
+    - reference: median of every publisher's values for the pair over the trailing window
+    - deviation_bps: the entry against that reference
+    - staleness_s: arrival minus entry time when arrival is known, otherwise how far the
+      entry's timestamp lags the newest timestamp already seen for the pair, clipped at 0
+    - clock_skew_s: how far the entry's timestamp is ahead of its arrival. Publishers whose
+      clocks run ahead of block time would otherwise show negative staleness
+    - interval_s: time since the publisher's previous entry for the pair from the same source
+    """
+    entries = entries.reset_index(drop=True)
+    by_time = entries.sort_values(["pair", "time"], kind="stable")
+    reference = by_time.groupby("pair", observed=True, sort=False).rolling(window, on="time")["value"].median()
+    # by_time is sorted by pair and groups come out in order of appearance, so the
+    # rolling medians line up with by_time's rows
+    entries.loc[by_time.index, "reference"] = reference.to_numpy()
+    entries["deviation_bps"] = (entries["value"] / entries["reference"] - 1) * 10**4
+    newest = entries.groupby("pair", observed=True)["time"].cummax()
+    staleness = entries["arrival"] - entries["time"] if entries["arrival"].notna().any() else newest - entries["time"]
+    staleness = staleness.dt.total_seconds()
+    entries["staleness_s"] = staleness.clip(lower=0)
+    entries["clock_skew_s"] = staleness.clip(upper=0).abs()
+    by_publisher = entries.sort_values(["publisher", "source", "pair", "time"], kind="stable")
+    entries["interval_s"] = by_publisher.groupby(["publisher", "source", "pair"], observed=True)["time"].diff().dt.total_seconds()
+    return entries
+
+
+def publisher_scores(entries, window="5min", outlier_bps=100):
+    """Quality of every publisher on every pair, in one grouped pass.
+
+    An entry is an outlier when it deviates from the pair's rolling median by at least `outlier_bps`.
+    """
+    with METRICS.stage("publisher_quality.scores"):
+        entries = add_entry_metrics(entries, window)
+        entries["abs_deviation_bps"] = entries["deviation_bps"].abs()
+        entries["outlier"] = entries["abs_deviation_bps"] >= outlier_bps
+        grouped = entries.groupby(["publisher", "pair"], observed=True)
+        scores = grouped.agg(
+            entries=("value", "size"),
+            sources=("source", "nunique"),
+            mean_deviation_bps=("deviation_bps", "mean"),
+            mean_abs_deviation_bps=("abs_deviation_bps", "mean"),
+            max_abs_deviation_bps=("abs_deviation_bps", "max"),
+            outlier_rate=("outlier", "mean"),
+            mean_staleness_s=("staleness_s", "mean"),
+            max_staleness_s=("staleness_s", "max"),
+            mean_clock_skew_s=("clock_skew_s", "mean"),
+            max_clock_skew_s=("clock_skew_s", "max"),
+            median_interval_s=("interval_s", "median"),
+            first_update=("time", "min"),
+            last_update=("time", "max"),
+        )
+        quantiles = grouped[["abs_deviation_bps", "staleness_s", "interval_s"]].quantile(0.95)
+        scores = scores.join(quantiles.add_prefix("p95_"))
+    METRICS.increment("publisher_quality_entries_total", len(entries))
+    return scores
+
+
+def publisher_ranking(scores):
+    """One row per publisher, pairs weighted by entry count, ranked by mean absolute deviation."""
+    weights = scores["entries"]
+    weighted = scores[["mean_abs_deviation_bps", "outlier_rate", "mean_staleness_s", "mean_clock_skew_s"]].mul(weights, axis=0)
+    ranking = weighted.groupby(level="publisher", observed=True).sum().div(
+        weights.groupby(level="publisher", observed=True).sum(), axis=0
+    )
+    ranking["entries"] = weights.groupby(level="publisher", observed=True).sum()
+    ranking["pairs"] = weights.groupby(level="publisher", observed=True).size()
+    ranking["median_interval_s"] = scores["median_interval_s"].groupby(level="publisher", observed=True).median()
+    ranking["rank"] = ranking["mean_abs_deviation_bps"].rank(method="min").astype(int)
+    return ranking.sort_values("rank")
+
+
+if __name__ == "__main__":
+    entries = load_csv_entries() if os.path.isfile(EVENTS_CSV_FILE) else load_archive_entries()
+    scores = publisher_scores(entries)
+    print(scores.to_string())
+    print(publisher_ranking(scores).to_string())
+    export_metrics("publisher_quality")
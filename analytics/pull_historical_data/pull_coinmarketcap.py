@@ -1,41 +1,189 @@
-import datetime
+import argparse
+import asyncio
+import json
 import os
-import time
+import sys
 
 import pandas as pd
-import requests
-
-
-def main(start_time):
-    print(f"Fetching Coinmarketcap data at time: {start_time}")
-    data_output_filename = "coinmarketcap_historical_data.csv"
-
-    COINMARKETCAP_KEY = os.environ.get("COINMARKETCAP_API_KEY")
-    response = requests.get(
-        "https://pro-api.coinmarketcap.com/v2/cryptocurrency/quotes/historical",
-        headers={
-            "X-CMC_PRO_API_KEY": COINMARKETCAP_KEY,
-            "Accepts": "application/json",
-        },
-        params={"slug": "ethereum", "start": start_time, "count": 10000, "interval": "30m"},
-    )
-    print(response.json())
-    result = [{
-        "value": quote["USD"]["price"],
-        "timestamp": int(
-            datetime.datetime.strptime(
-                quote["USD"]["timestamp"],
-                "%Y-%m-%dT%H:%M:%S.%f%z",
-            ).timestamp()
-        ),
-    } for quote in response.json()["data"]["quotes"]]
-
-    df = pd.DataFrame(result, index=[0])
-    if not os.path.isfile(data_output_filename):
-        df.to_csv(data_output_filename)
-    else:
-        df.to_csv(data_output_filename, mode="a", header=False)
+
+# src/ lives two levels up from this script
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from src.instrumentation import METRICS, export_metrics  # noqa: E402
+from src.node import AsyncNodeRequester, run_sync  # noqa: E402
+
+COINMARKETCAP_API = "https://pro-api.coinmarketcap.com"
+REFERENCE_DIRECTORY = "coinmarketcap-reference"
+# quotes/historical returns at most this many quotes per call
+MAX_COUNT = 10000
+INTERVALS = {
+    "5m": "5min", "10m": "10min", "15m": "15min", "30m": "30min", "45m": "45min",
+    "1h": "1h", "2h": "2h", "3h": "3h", "4h": "4h", "6h": "6h", "12h": "12h", "24h": "24h",
+}
+# Basic plans allow 30 calls a minute
+RATE_LIMIT = 0.5
+MAX_CONCURRENCY = 4
+
+
+def to_timestamp(value):
+    value = pd.Timestamp(value)
+    return value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+
+
+def windows(start, end, interval, count=MAX_COUNT):
+    """Splits [start, end) into windows of at most `count` quotes at `interval`."""
+    step = pd.Timedelta(INTERVALS[interval]) * count
+    window_start = start
+    while window_start < end:
+        yield window_start, min(window_start + step, end)
+        window_start += step
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class ReferenceStore:
+    """
+    Deduplicated, time sorted CoinMarketCap quotes, one Parquet file per slug and interval.
+
+    A JSON manifest next to each file records the time ranges already fetched, so a
+    backfill only requests what is missing, including ranges the API had no quotes for.
+    """
+
+    def __init__(self, directory=REFERENCE_DIRECTORY):
+        self.directory = directory
+
+    def path(self, slug, interval):
+        return os.path.join(self.directory, slug, f"{interval}.parquet")
+
+    def manifest_path(self, slug, interval):
+        return os.path.join(self.directory, slug, f"{interval}.json")
+
+    def covered(self, slug, interval):
+        path = self.manifest_path(slug, interval)
+        if not os.path.isfile(path):
+            return []
+        with open(path) as manifest_file:
+            return [[to_timestamp(start), to_timestamp(end)] for start, end in json.load(manifest_file)["covered"]]
+
+    def missing(self, slug, interval, start, end):
+        """Sub-ranges of [start, end) not fetched yet."""
+        gaps, cursor = [], start
+        for covered_start, covered_end in self.covered(slug, interval):
+            if covered_end <= cursor or covered_start >= end:
+                continue
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def read(self, slug, interval, start=None, end=None):
+        path = self.path(slug, interval)
+        if not os.path.isfile(path):
+            return pd.DataFrame({"timestamp": pd.Series(dtype="int64"), "value": pd.Series(dtype="float64")})
+        quotes = pd.read_parquet(path)
+        if start is not None:
+            quotes = quotes[quotes["timestamp"] >= to_timestamp(start).timestamp()]
+        if end is not None:
+            quotes = quotes[quotes["timestamp"] < to_timestamp(end).timestamp()]
+        return quotes.reset_index(drop=True)
+
+    def merge(self, slug, interval, quotes, start, end):
+        """Merges one fetched window and marks [start, end) as covered."""
+        merged = pd.concat([self.read(slug, interval), quotes], ignore_index=True)
+        merged = merged.drop_duplicates("timestamp", keep="last").sort_values("timestamp", kind="stable")
+        path = self.path(slug, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        merged.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        covered = merge_ranges(self.covered(slug, interval) + [[start, end]])
+        manifest_path = self.manifest_path(slug, interval)
+        with open(f"{manifest_path}.tmp", "w") as manifest_file:
+            json.dump({"covered": [[start.isoformat(), end.isoformat()] for start, end in covered]}, manifest_file, indent=1)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        METRICS.set_gauge("coinmarketcap_reference_quotes", len(merged), slug=slug, interval=interval)
+
+
+def parse_quotes(data):
+    # v2 answers keyed by coin id, v1 with the quotes at the top level
+    coins = [data] if "quotes" in data else data.values()
+    usd = [quote["quote"]["USD"] for coin in coins for quote in coin["quotes"]]
+    # Parsed as one column, strptime per quote dominated a year long backfill
+    times = pd.to_datetime(pd.Series([quote["timestamp"] for quote in usd], dtype=object), utc=True)
+    return pd.DataFrame({
+        "timestamp": ((times - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).astype("int64"),
+        "value": pd.Series([quote["price"] for quote in usd], dtype="float64"),
+    })
+
+
+async def fetch_window(requester, slug, interval, start, end):
+    with METRICS.timer("coinmarketcap_window_seconds", interval=interval):
+        response = await requester.get("/v2/cryptocurrency/quotes/historical", params={
+            "slug": slug, "time_start": start.isoformat(), "time_end": end.isoformat(),
+            "interval": interval, "count": MAX_COUNT, "convert": "USD",
+        })
+    quotes = parse_quotes(response["data"])
+    METRICS.increment("coinmarketcap_quotes_total", len(quotes), slug=slug)
+    return quotes
+
+
+async def backfill(slugs, start, end, interval="5m", store=None, api_key=None, rate_limit=RATE_LIMIT, max_concurrency=MAX_CONCURRENCY):
+    """Fetches every missing window of every slug concurrently, merging each into the store as it lands.
+
+    Returns the number of windows fetched. Ranges already in the store are skipped, so an
+    interrupted, failed or extended backfill only requests what is left.
+    """
+    store = store or ReferenceStore()
+    start, end = to_timestamp(start), min(to_timestamp(end), pd.Timestamp.now(tz="UTC").floor("s"))
+    jobs = [
+        (slug, window_start, window_end)
+        for slug in slugs
+        for gap_start, gap_end in store.missing(slug, interval, start, end)
+        for window_start, window_end in windows(gap_start, gap_end, interval)
+    ]
+    print(f"Fetching {len(jobs)} windows of {interval} quotes for {', '.join(slugs)}")
+    headers = {"X-CMC_PRO_API_KEY": api_key or os.environ.get("COINMARKETCAP_API_KEY"), "Accepts": "application/json"}
+    async with AsyncNodeRequester(COINMARKETCAP_API, headers=headers, max_concurrency=max_concurrency, rate_limit=rate_limit) as requester:
+        async def fetch(slug, window_start, window_end):
+            try:
+                return slug, window_start, window_end, await fetch_window(requester, slug, interval, window_start, window_end)
+            except Exception as e:
+                # The window stays missing and is requested again by the next run
+                print(f"{slug}: window from {window_start} to {window_end} failed: {e}")
+                METRICS.increment("coinmarketcap_window_errors_total", slug=slug)
+                return slug, window_start, window_end, None
+
+        fetched = 0
+        for future in asyncio.as_completed([fetch(*job) for job in jobs]):
+            slug, window_start, window_end, quotes = await future
+            if quotes is None:
+                continue
+            store.merge(slug, interval, quotes, window_start, window_end)
+            fetched += 1
+            print(f"{slug}: {len(quotes)} quotes from {window_start} to {window_end}")
+    return fetched
 
 
 if __name__ == "__main__":
-    main(1675209600)  # 1675209600 = 1-02-2023 / 1661990400 = 1-09-2023
+    parser = argparse.ArgumentParser(description="Backfill CoinMarketCap reference prices into a deduplicated Parquet store")
+    parser.add_argument("--slugs", nargs="+", default=["ethereum"])
+    parser.add_argument("--start", default="2023-02-01")
+    parser.add_argument("--end", default=pd.Timestamp.now(tz="UTC").isoformat())
+    parser.add_argument("--interval", choices=list(INTERVALS), default="5m")
+    parser.add_argument("--directory", default=REFERENCE_DIRECTORY)
+    parser.add_argument("--rate-limit", type=float, default=RATE_LIMIT, help="Requests per second")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    args = parser.parse_args()
+    run_sync(backfill(
+        args.slugs, args.start, args.end, args.interval, ReferenceStore(args.directory),
+        rate_limit=args.rate_limit, max_concurrency=args.max_concurrency,
+    ))
+    export_metrics("coinmarketcap_backfill")
@@ -0,0 +1,175 @@
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from historical_dataset import HISTORICAL_PARQUET_DIRECTORY, list_partitions
+from streaming_resample import aggregate_bars
+from src.instrumentation import METRICS, export_metrics
+
+ROLLUP_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "data", "rollups")
+RESOLUTIONS = {"1m": "1min", "1h": "1h", "1d": "1D"}
+ALL_SOURCES = "ALL"
+
+
+def build_bars(rows):
+    """Bars of `rows` (pair_id, source, time, price) at every resolution, per pair and source,
+    plus an ALL source aggregating every source of a pair."""
+    rows = pd.concat([rows, rows.assign(source=ALL_SOURCES)], ignore_index=True)
+    return {
+        resolution: aggregate_bars(rows.assign(bucket=rows["time"].dt.floor(freq)), keys=["pair_id", "source"])
+        for resolution, freq in RESOLUTIONS.items()
+    }
+
+
+def write_bars(bars, directory, name):
+    for resolution, frame in bars.items():
+        os.makedirs(os.path.join(directory, resolution), exist_ok=True)
+        table = pa.Table.from_pandas(frame.astype({"pair_id": str, "source": str}), preserve_index=False)
+        pq.write_table(table, os.path.join(directory, resolution, f"{name}.parquet"))
+
+
+class RollupCache:
+    """
+    Materialized 1m/1h/1d bars per pair and source.
+
+    Archive bars are stored in one partition per UTC day. The manifest records every input
+    file's mtime, size and block time span, and which files each day was built from, so a
+    refresh only rebuilds the days touched by new, changed or removed files. Loader frames
+    (price_feeds / Kaiko data) are rolled up under their own name and only rebuilt when the
+    frame's content hash changes.
+    """
+
+    def __init__(self, directory=ROLLUP_DIRECTORY, parquet_directory=HISTORICAL_PARQUET_DIRECTORY):
+        self.directory = directory
+        self.parquet_directory = parquet_directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.manifest = {"files": {}, "days": {}, "frames": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+
+    def save_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f"{self.manifest_path}.tmp", "w") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=1, sort_keys=True)
+        os.replace(f"{self.manifest_path}.tmp", self.manifest_path)
+
+    @staticmethod
+    def file_days(start, end):
+        return [day.strftime("%Y-%m-%d") for day in pd.date_range(pd.Timestamp(start).floor("D"), pd.Timestamp(end).floor("D"), freq="D")]
+
+    def scan_file(self, path):
+        times = pc.cast(pq.read_table(path, columns=["block_timestamp"])["block_timestamp"], pa.timestamp("s", tz="UTC"))
+        bounds = pc.min_max(times).as_py()
+        stat = os.stat(path)
+        return {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "start": bounds["min"].isoformat(),
+            "end": bounds["max"].isoformat(),
+        }
+
+    def refresh(self):
+        """Rebuilds the day partitions whose input files changed since the last refresh.
+
+        Returns the rebuilt days.
+        """
+        current = {os.path.basename(path): path for path in list_partitions(self.parquet_directory)}
+        files = self.manifest["files"]
+        stale_days = set()
+        for name in set(files) - set(current):
+            stale_days.update(self.file_days(files[name]["start"], files[name]["end"]))
+            del files[name]
+        for name, path in current.items():
+            stat = os.stat(path)
+            known = files.get(name)
+            if known and known["mtime"] == stat.st_mtime and known["size"] == stat.st_size:
+                continue
+            if known:
+                stale_days.update(self.file_days(known["start"], known["end"]))
+            files[name] = self.scan_file(path)
+            stale_days.update(self.file_days(files[name]["start"], files[name]["end"]))
+        with METRICS.stage("rollups.refresh"):
+            for day in sorted(stale_days):
+                self.build_day(day, current)
+        METRICS.increment("rollup_days_rebuilt_total", len(stale_days))
+        self.save_manifest()
+        return sorted(stale_days)
+
+    def build_day(self, day, current):
+        inputs = sorted(name for name, info in self.manifest["files"].items() if day in self.file_days(info["start"], info["end"]))
+        if not inputs:
+            for resolution in RESOLUTIONS:
+                path = os.path.join(self.directory, "archive", resolution, f"{day}.parquet")
+                if os.path.exists(path):
+                    os.remove(path)
+            self.manifest["days"].pop(day, None)
+            return
+        start = pd.Timestamp(day, tz="UTC")
+        dataset = ds.dataset([current[name] for name in inputs])
+        table = dataset.to_table(columns=["pair_id", "source", "block_timestamp", "price"])
+        times = pc.cast(table["block_timestamp"], pa.timestamp("ns", tz="UTC"))
+        in_day = pc.and_(pc.greater_equal(times, pa.scalar(start.value, pa.timestamp("ns", tz="UTC"))),
+                         pc.less(times, pa.scalar((start + pd.Timedelta(days=1)).value, pa.timestamp("ns", tz="UTC"))))
+        rows = pd.DataFrame({
+            "pair_id": table["pair_id"].to_pandas(),
+            "source": table["source"].to_pandas(),
+            "time": times.to_pandas(),
+            "price": table["price"].to_pandas(),
+        })[in_day.to_numpy(zero_copy_only=False)]
+        write_bars(build_bars(rows), os.path.join(self.directory, "archive"), day)
+        self.manifest["days"][day] = inputs
+
+    def rollup_frame(self, name, frame, price_column="price", pair_column="feed"):
+        """Rolls up a loader frame (date or timestamp, price, feed) under source `name`.
+
+        Returns False when the frame is unchanged since its last rollup.
+        """
+        fingerprint = str(int(pd.util.hash_pandas_object(frame.reset_index(), index=False).sum()))
+        if self.manifest["frames"].get(name) == fingerprint:
+            return False
+        frame = frame.reset_index() if "date" not in frame.columns and "timestamp" not in frame.columns else frame
+        if "date" in frame.columns:
+            times = pd.to_datetime(frame["date"], utc=True)
+        else:
+            times = pd.to_datetime(frame["timestamp"], unit="s", utc=True)
+        rows = pd.DataFrame({
+            "pair_id": frame[pair_column].astype(str).to_numpy() if pair_column in frame.columns else name,
+            "source": name,
+            "time": times.to_numpy(),
+            "price": pd.to_numeric(frame[price_column]).to_numpy(dtype=float),
+        })
+        rows["time"] = pd.to_datetime(rows["time"], utc=True)
+        write_bars(build_bars(rows), os.path.join(self.directory, "feeds"), name)
+        self.manifest["frames"][name] = fingerprint
+        self.save_manifest()
+        return True
+
+    def read(self, resolution="1h", pairs=None, sources=None, start=None, end=None, kind="archive"):
+        """Reads bars of `kind` ("archive" or "feeds") with pair/source/time pushdown."""
+        directory = os.path.join(self.directory, kind, resolution)
+        if not os.path.isdir(directory) or not os.listdir(directory):
+            return pd.DataFrame()
+        expression = None
+        for condition in [
+            ds.field("pair_id").isin(list(pairs)) if pairs is not None else None,
+            ds.field("source").isin(list(sources)) if sources is not None else None,
+            ds.field("bucket") >= pd.Timestamp(start, tz="UTC") if start is not None else None,
+            ds.field("bucket") < pd.Timestamp(end, tz="UTC") if end is not None else None,
+        ]:
+            if condition is not None:
+                expression = condition if expression is None else expression & condition
+        table = ds.dataset(directory).to_table(filter=expression)
+        return table.to_pandas().sort_values(["pair_id", "source", "bucket"], kind="stable").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    cache = RollupCache()
+    print(f"Rebuilt {len(cache.refresh())} day partitions")
+    print(cache.read("1d", pairs=["ETH/USD"], sources=[ALL_SOURCES]).to_string())
+    export_metrics("rollups")
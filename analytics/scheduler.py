@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import datetime
+import math
+import os
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# The analytics scripts run from this directory, src/ lives one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.instrumentation import METRICS, export_metrics  # noqa: E402
+from src.node import AsyncNodeRequester  # noqa: E402
+
+PRICES_DIRECTORY = "live-prices"
+COINMARKETCAP_API = "https://pro-api.coinmarketcap.com"
+STORK_CONTRACT_ADDRESS = "0x0178a8866ef77a01df365b49d03fe46b8a90703e9fa1e10518277d12153b93d7"
+
+PRICE_SCHEMA = pa.schema([
+    ("source", pa.string()),
+    ("asset", pa.string()),
+    ("value", pa.float64()),
+    # Time the source reports for the value, epoch seconds
+    ("timestamp", pa.float64()),
+    # Slot the poll was scheduled for and the time its response arrived
+    ("scheduled_at", pa.timestamp("us", tz="UTC")),
+    ("received_at", pa.timestamp("us", tz="UTC")),
+])
+
+
+def epoch_us(seconds):
+    return int(round(seconds * 10**6))
+
+
+class ParquetSink:
+    """
+    Buffered, rotating Parquet writer for polled prices.
+
+    Rows are buffered in memory and appended as one row group per flush, either when
+    `flush_rows` rows are buffered or when the scheduler's flush timer fires. Files rotate
+    every `rotate_seconds` of wall clock time: prices-YYYYMMDDTHHMMSS.parquet.
+    The open file is written under a leading dot, which Parquet dataset readers skip,
+    and renamed into place once complete.
+    """
+
+    def __init__(self, directory=PRICES_DIRECTORY, rotate_seconds=3600, flush_rows=10_000):
+        self.directory = directory
+        self.rotate_seconds = rotate_seconds
+        self.flush_rows = flush_rows
+        self.buffer = []
+        self.writer = None
+        self.path = None
+        self.period = None
+
+    def append(self, rows):
+        self.buffer.extend(rows)
+        return len(self.buffer) >= self.flush_rows
+
+    def drain(self):
+        rows, self.buffer = self.buffer, []
+        return rows
+
+    def flush(self, rows=None):
+        """Writes `rows`, by default everything buffered. The scheduler drains the buffer on the
+        event loop and writes from a worker thread, so polls keep appending meanwhile."""
+        rows = self.drain() if rows is None else rows
+        if not rows:
+            return
+        period = int(time.time() // self.rotate_seconds)
+        if period != self.period:
+            self.close()
+            self.open(period)
+        rows.sort(key=lambda row: row["scheduled_at"])
+        columns = {name: [row.get(name) for row in rows] for name in PRICE_SCHEMA.names}
+        self.writer.write_table(pa.table(columns, schema=PRICE_SCHEMA))
+        METRICS.increment("scheduler_rows_written_total", len(rows))
+
+    def open(self, period):
+        os.makedirs(self.directory, exist_ok=True)
+        started = datetime.datetime.fromtimestamp(period * self.rotate_seconds, datetime.timezone.utc)
+        name = f"prices-{started:%Y%m%dT%H%M%S}"
+        suffix = 0
+        # A restart within the same period starts a new file next to the previous one
+        while os.path.exists(os.path.join(self.directory, f"{name}{f'-{suffix}' if suffix else ''}.parquet")):
+            suffix += 1
+        self.path = os.path.join(self.directory, f"{name}{f'-{suffix}' if suffix else ''}.parquet")
+        self.writer = pq.ParquetWriter(self.pending_path(), PRICE_SCHEMA)
+        self.period = period
+
+    def pending_path(self):
+        return os.path.join(os.path.dirname(self.path), f".{os.path.basename(self.path)}")
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self.pending_path(), self.path)
+        METRICS.increment("scheduler_files_written_total")
+        self.writer, self.path, self.period = None, None, None
+
+
+class CoinMarketCapSource:
+    """
+    CoinMarketCap latest quotes, every slug in a single request over one pooled session.
+    Rows are keyed by the coin's pair (ETH/USD for ethereum), like the oracle sources.
+    """
+
+    name = "coinmarketcap"
+
+    def __init__(self, slugs, api_key=None, convert="USD"):
+        self.slugs = list(slugs)
+        self.convert = convert
+        self.requester = AsyncNodeRequester(
+            COINMARKETCAP_API, headers={
+                "X-CMC_PRO_API_KEY": api_key or os.environ.get("COINMARKETCAP_API_KEY"),
+                "Accepts": "application/json",
+            }, max_concurrency=4
+        )
+
+    async def open(self):
+        await self.requester.__aenter__()
+
+    async def close(self):
+        await self.requester.__aexit__(None, None, None)
+
+    async def poll(self):
+        response = await self.requester.get(
+            "/v2/cryptocurrency/quotes/latest", params={"slug": ",".join(self.slugs), "convert": self.convert}
+        )
+        rows = []
+        for coin in response["data"].values():
+            quote = coin["quote"][self.convert]
+            last_updated = datetime.datetime.strptime(quote["last_updated"], "%Y-%m-%dT%H:%M:%S.%f%z")
+            rows.append({"asset": f"{coin['symbol']}/{self.convert}", "value": quote["price"], "timestamp": last_updated.timestamp()})
+        return rows
+
+
+class StorkSource:
+    """
+    Stork `get_value` on StarkNet. The contract is resolved once when the source is opened,
+    then every asset is called concurrently on each poll.
+    """
+
+    name = "stork"
+
+    def __init__(self, assets, contract_address=STORK_CONTRACT_ADDRESS, network="testnet"):
+        self.assets = list(assets)
+        self.contract_address = contract_address
+        self.network = network
+        self.contract = None
+
+    async def open(self):
+        # starknet.py is only needed when Stork is polled
+        from starknet_py.contract import Contract
+        from starknet_py.net.gateway_client import GatewayClient
+
+        self.contract = await Contract.from_address(self.contract_address, GatewayClient(self.network))
+
+    async def close(self):
+        self.contract = None
+
+    async def poll(self):
+        results = await asyncio.gather(*[self.contract.functions["get_value"].call(asset) for asset in self.assets])
+        return [
+            {"asset": asset, "value": float(result.value), "timestamp": float(getattr(result, "timestamp", math.nan))}
+            for asset, result in zip(self.assets, results)
+        ]
+
+
+class PollingScheduler:
+    """
+    Polls every registered source on its own fixed cadence from a single event loop.
+
+    Slots are aligned to multiples of the interval in wall clock time (plus an offset), and
+    each slot is computed from that grid rather than from the end of the previous poll, so
+    the cadence never drifts. A poll that overruns its interval skips the slots it missed
+    instead of bunching them up. Sources are opened once and keep their clients between polls.
+    """
+
+    def __init__(self, sink, flush_interval=60):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.jobs = []
+        self.flush_lock = None
+
+    def add(self, source, interval, offset=0.0):
+        self.jobs.append((source, interval, offset))
+        return self
+
+    @staticmethod
+    def next_slot(interval, offset, now):
+        return math.floor((now - offset) / interval + 1) * interval + offset
+
+    async def run(self, duration=None):
+        """Polls until cancelled, or for `duration` seconds, then flushes and closes the sink."""
+        self.flush_lock = asyncio.Lock()
+        await asyncio.gather(*[source.open() for source, _, _ in self.jobs])
+        deadline = time.time() + duration if duration is not None else None
+        tasks = [asyncio.ensure_future(self.poll_forever(*job, deadline)) for job in self.jobs]
+        flusher = asyncio.ensure_future(self.flush_forever())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            flusher.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, flusher, return_exceptions=True)
+            await asyncio.gather(*[source.close() for source, _, _ in self.jobs], return_exceptions=True)
+            await self.flush()
+            self.sink.close()
+
+    async def poll_forever(self, source, interval, offset, deadline):
+        slot = self.next_slot(interval, offset, time.time())
+        while deadline is None or slot < deadline:
+            await asyncio.sleep(max(slot - time.time(), 0))
+            await self.poll(source, slot)
+            following = self.next_slot(interval, offset, time.time())
+            missed = round((following - slot) / interval) - 1
+            if missed:
+                METRICS.increment("scheduler_missed_slots_total", missed, source=source.name)
+            slot = following
+
+    async def poll(self, source, slot):
+        METRICS.observe("scheduler_start_lag_seconds", time.time() - slot, source=source.name)
+        try:
+            with METRICS.timer("scheduler_poll_seconds", source=source.name):
+                rows = await source.poll()
+        except Exception as e:
+            # One failing source or tick must not stop the others
+            METRICS.increment("scheduler_polls_total", source=source.name, status="error")
+            print(f"{source.name}: poll at {slot} failed: {e!r}")
+            return
+        received_at = epoch_us(time.time())
+        METRICS.increment("scheduler_polls_total", source=source.name, status="ok")
+        rows = [dict(row, source=source.name, scheduled_at=epoch_us(slot), received_at=received_at) for row in rows]
+        if self.sink.append(rows):
+            await self.flush()
+
+    async def flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        async with self.flush_lock:
+            await asyncio.to_thread(self.sink.flush, self.sink.drain())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll live reference and oracle prices into a rotating Parquet dataset")
+    parser.add_argument("--coinmarketcap", nargs="*", default=["ethereum"], help="CoinMarketCap slugs")
+    parser.add_argument("--coinmarketcap-interval", type=float, default=30)
+    parser.add_argument("--stork", nargs="*", default=["ETH/USD"], help="Stork assets")
+    parser.add_argument("--stork-interval", type=float, default=180)
+    parser.add_argument("--directory", default=PRICES_DIRECTORY)
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run for, forever by default")
+    parser.add_argument("--monitor", action="store_true", help="Also feed every polled price to the oracle monitor")
+    args = parser.parse_args()
+
+    sink = ParquetSink(args.directory)
+    if args.monitor:
+        from monitor import MonitorSink, OracleMonitor
+
+        sink = MonitorSink(OracleMonitor(), sink)
+    scheduler = PollingScheduler(sink)
+    if args.coinmarketcap:
+        scheduler.add(CoinMarketCapSource(args.coinmarketcap), args.coinmarketcap_interval)
+    if args.stork:
+        scheduler.add(StorkSource(args.stork), args.stork_interval)
+    try:
+        asyncio.run(scheduler.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    if args.monitor:
+        for feed in sink.monitor.summary():
+            print(feed)
+    export_metrics("scheduler")
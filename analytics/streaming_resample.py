@@ -0,0 +1,89 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from historical_dataset import HISTORICAL_PARQUET_DIRECTORY, historical_filter, list_partitions
+from src.instrumentation import METRICS, export_metrics
+
+BAR_COLUMNS = ["pair_id", "bucket", "open", "high", "low", "close", "median", "count"]
+
+
+def aggregate_bars(rows, keys=("pair_id",)):
+    """Exact OHLC, median and count bars of `rows` (keys, bucket, time, price), per keys and bucket."""
+    keys = list(keys) + ["bucket"]
+    rows = rows.sort_values(keys + ["time"], kind="stable")
+    grouped = rows.groupby(keys, observed=True, sort=False)["price"]
+    bars = grouped.agg(open="first", high="max", low="min", close="last", median="median", count="size")
+    return bars.reset_index()
+
+
+def stream_bars(
+    parquet_directory=HISTORICAL_PARQUET_DIRECTORY,
+    freq="1h",
+    pairs=None,
+    time_column="block_timestamp",
+    lateness="0s",
+    batch_size=65536,
+):
+    """Yields closed bars while scanning the archive file by file, batch by batch.
+
+    Only the rows of buckets that are still open (straddling the current batch boundary)
+    are carried between batches, so memory does not grow with the archive. A bucket closes
+    once the largest time seen is `lateness` past its end: block_timestamp follows the
+    file order and needs none, entry `timestamp` can lag its block by hours and needs a
+    matching allowance. Rows arriving for an already emitted bucket are dropped and reported.
+    """
+    freq = pd.Timedelta(freq)
+    lateness = pd.Timedelta(lateness)
+    carry = pd.DataFrame({"pair_id": pd.Series(dtype=object), "time": pd.Series(dtype="datetime64[ns, UTC]"), "price": pd.Series(dtype=float)})
+    watermark = None
+    late_rows = 0
+    for path in list_partitions(parquet_directory):
+        batches = ds.dataset(path).to_batches(
+            columns=["pair_id", time_column, "price"],
+            filter=historical_filter(pairs),
+            batch_size=batch_size,
+        )
+        for batch in batches:
+            if batch.num_rows == 0:
+                continue
+            METRICS.increment("stream_rows_total", batch.num_rows)
+            rows = pd.DataFrame({
+                "pair_id": batch.column("pair_id").to_numpy(zero_copy_only=False),
+                "time": pc.cast(batch.column(time_column), pa.timestamp("ns", tz="UTC")).to_pandas(),
+                "price": batch.column("price").to_numpy(zero_copy_only=False).astype(float),
+            })
+            if watermark is not None:
+                late = (rows["time"].dt.floor(freq) + freq) <= watermark
+                late_rows += int(late.sum())
+                rows = rows[~late]
+            rows = pd.concat([carry, rows], ignore_index=True)
+            rows["bucket"] = rows["time"].dt.floor(freq)
+            batch_watermark = rows["time"].max() - lateness
+            watermark = batch_watermark if watermark is None else max(watermark, batch_watermark)
+            closed = (rows["bucket"] + freq <= watermark).to_numpy()
+            if closed.any():
+                yield aggregate_bars(rows[closed])
+            carry = rows.loc[~closed, ["pair_id", "time", "price"]]
+    if not carry.empty:
+        carry = carry.assign(bucket=carry["time"].dt.floor(freq))
+        yield aggregate_bars(carry)
+    METRICS.increment("stream_late_rows_total", late_rows)
+    if late_rows:
+        print(f"Dropped {late_rows} rows older than their closed bucket, raise `lateness` to keep them")
+
+
+def resample_archive(parquet_directory=HISTORICAL_PARQUET_DIRECTORY, freq="1h", pairs=None, time_column="block_timestamp", lateness="0s"):
+    with METRICS.stage("streaming.resample"):
+        bars = list(stream_bars(parquet_directory, freq, pairs, time_column, lateness))
+    if not bars:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    return pd.concat(bars, ignore_index=True).sort_values(["pair_id", "bucket"], kind="stable").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    hourly = resample_archive(freq="1h", pairs=["ETH/USD"])
+    hourly["median"] = hourly["median"] / 10**8
+    print(hourly.tail(24).to_string())
+    export_metrics("streaming_resample")
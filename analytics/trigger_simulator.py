@@ -0,0 +1,110 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from historical_dataset import HISTORICAL_PARQUET_DIRECTORY, epoch_seconds, read_historical, to_tick_array
+from src.instrumentation import METRICS, export_metrics
+
+SCAN_CHUNK = 32
+
+
+def load_ticks(parquet_directory=HISTORICAL_PARQUET_DIRECTORY, pairs=None, start=None, end=None):
+    """Per-block aggregated price of each pair: the median of the entries landing in a block.
+
+    Returns a TickArray timestamped with the blocks' epoch seconds, sorted by pair and time.
+    """
+    df = read_historical(
+        parquet_directory, pairs=pairs, start=start, end=end,
+        columns=["pair_id", "block_number", "block_timestamp", "price"],
+    )
+    ticks = df.groupby(["pair_id", "block_number"], observed=True).agg(
+        block_timestamp=("block_timestamp", "first"), price=("price", "median")
+    ).reset_index()
+    ticks["time"] = epoch_seconds(ticks["block_timestamp"])
+    ticks = ticks.sort_values(["pair_id", "time"], kind="stable")
+    return to_tick_array(ticks["pair_id"], ticks["price"], ticks["time"].to_numpy())
+
+
+def next_trigger(prices, start, stop, published, threshold):
+    """First index in (start, stop) deviating from `published` by at least `threshold`, or `stop`.
+
+    Scans in growing chunks so a quick trigger does not pay for the whole heartbeat window.
+    Also returns the largest deviation seen up to and including the trigger tick, which is
+    the heartbeat tick at `stop` when nothing deviates before it.
+    """
+    position, chunk, max_error = start + 1, SCAN_CHUNK, 0.0
+    while position < stop:
+        window = np.abs(prices[position : min(position + chunk, stop)] / published - 1)
+        breaches = np.flatnonzero(window >= threshold)
+        if breaches.size:
+            return position + breaches[0], max(max_error, window[: breaches[0] + 1].max())
+        max_error = max(max_error, window.max())
+        position += chunk
+        chunk *= 2
+    if stop < len(prices):
+        max_error = max(max_error, abs(prices[stop] / published - 1))
+    return stop, max_error
+
+
+def simulate_policy(times, prices, deviation_bps, heartbeat_s):
+    """Replays a push oracle over ticks: publish when price moves `deviation_bps` from the last
+    published value or when `heartbeat_s` elapsed since the last update, whichever comes first.
+    """
+    threshold = deviation_bps / 10**4
+    n = len(prices)
+    if n == 0:
+        return {"updates": 0, "max_staleness_s": np.nan, "max_error_bps": np.nan}
+    index, updates, max_staleness, max_error = 0, 1, 0, 0.0
+    while True:
+        heartbeat = np.searchsorted(times, times[index] + heartbeat_s, side="left")
+        trigger, error = next_trigger(prices, index, min(heartbeat, n), prices[index], threshold)
+        max_error = max(max_error, error)
+        if trigger >= n:
+            # The last published value stays live until the end of the series
+            max_staleness = max(max_staleness, times[-1] - times[index])
+            break
+        max_staleness = max(max_staleness, times[trigger] - times[index])
+        index = trigger
+        updates += 1
+    return {"updates": updates, "max_staleness_s": max_staleness, "max_error_bps": max_error * 10**4}
+
+
+def simulate_pair(pair_ticks, policies):
+    times = pair_ticks.timestamps
+    prices = pair_ticks.prices()
+    days = max((times[-1] - times[0]) / 86400, 1 / 24) if len(times) else np.nan
+    rows = []
+    for deviation_bps, heartbeat_s in policies:
+        result = simulate_policy(times, prices, deviation_bps, heartbeat_s)
+        rows.append({
+            "deviation_bps": deviation_bps,
+            "heartbeat_s": heartbeat_s,
+            **result,
+            "updates_per_day": result["updates"] / days,
+        })
+    return pd.DataFrame(rows)
+
+
+def simulate_triggers(ticks, deviations_bps, heartbeats_s, processes=None):
+    """Sweeps every (deviation, heartbeat) combination over every pair of `ticks` (a TickArray).
+
+    Pairs are simulated on separate processes.
+    """
+    policies = list(itertools.product(deviations_bps, heartbeats_s))
+    pairs = [(pair, ticks.select(pairs=[pair])) for pair in ticks.pairs]
+    pairs = [(pair, pair_ticks) for pair, pair_ticks in pairs if len(pair_ticks)]
+    with METRICS.stage("triggers.simulate"), ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(partial(simulate_pair, policies=policies), [pair_ticks for _, pair_ticks in pairs])
+        reports = [result.assign(pair_id=pair) for (pair, _), result in zip(pairs, results)]
+    METRICS.increment("triggers_policies_simulated_total", len(policies) * len(pairs))
+    return pd.concat(reports, ignore_index=True).set_index(["pair_id", "deviation_bps", "heartbeat_s"])
+
+
+if __name__ == "__main__":
+    ticks = load_ticks()
+    report = simulate_triggers(ticks, deviations_bps=[10, 25, 50, 100], heartbeats_s=[600, 3600, 86400])
+    print(report.to_string())
+    export_metrics("trigger_simulator")
@@ -0,0 +1,154 @@
+"""
+Deterministic synthetic inputs for the benchmarks.
+
+Every generator takes a seed, so two runs at the same scale produce identical data
+and their timings can be compared.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.utils import str_to_felt, get_selector_from_name
+
+EMPIRIC_FEEDS = ['luna/usd', 'eth/usd', 'btc/usd']
+EMPIRIC_PUBLISHERS = ['coinbase', 'gemini', 'binance', 'ftx', 'kraken']
+ARCHIVE_PAIRS = ['BTC/USD', 'ETH/USD', 'STRK/USD', 'SOL/USD', 'USDC/USD']
+ARCHIVE_PUBLISHERS = ['FOURLEAF', 'AVNU', 'PROPELLER', 'SKYNET_TRADING', 'FLOWDESK']
+ARCHIVE_START = pd.Timestamp('2024-01-09T04:00:00Z')
+BLOCK_TIME = 12
+
+
+def submit_many_entries_calldata(rng, entries, timestamp):
+    """
+    Calldata of one submit_many_entries call matching src/abi/empiric_abi.json:
+    new_entries_len, Entry(key, value, timestamp, publisher)*, then the r and s signature arrays
+    """
+    calldata = [hex(entries)]
+    for index in range(entries):
+        calldata += [
+            hex(str_to_felt(EMPIRIC_FEEDS[index % len(EMPIRIC_FEEDS)])),
+            hex(int(rng.integers(10 ** 9, 10 ** 12)) * 10 ** 9),
+            hex(timestamp - int(rng.integers(0, 30))),
+            hex(str_to_felt(EMPIRIC_PUBLISHERS[index % len(EMPIRIC_PUBLISHERS)])),
+        ]
+    signatures = [hex(int(value)) for value in rng.integers(1, 2 ** 62, entries)]
+    return calldata + [hex(entries)] + signatures + [hex(entries)] + signatures
+
+
+def starknet_blocks(blocks, txs_per_block=4, entries_per_tx=6, contract_address=1, oracle_share=0.5,
+                    start_block=177896, start_time=1651795200, seed=0):
+    """
+    starknet_getBlockWithTxs JSON-RPC responses. A share `oracle_share` of the transactions
+    call submit_many_entries on `contract_address`, the rest target another contract.
+    """
+    rng = np.random.default_rng(seed)
+    selector = hex(get_selector_from_name('submit_many_entries'))
+    responses = []
+    for offset in range(blocks):
+        timestamp = start_time + offset * BLOCK_TIME
+        transactions = []
+        for index in range(txs_per_block):
+            oracle = rng.random() < oracle_share
+            transactions.append({
+                'type': 'INVOKE',
+                'transaction_hash': hex(int(rng.integers(1, 2 ** 62))),
+                'contract_address': hex(contract_address if oracle else contract_address + 1 + index),
+                'entry_point_selector': selector,
+                'calldata': submit_many_entries_calldata(rng, entries_per_tx, timestamp),
+            })
+        responses.append({'jsonrpc': '2.0', 'id': offset, 'result': {
+            'block_number': start_block + offset, 'timestamp': timestamp, 'transactions': transactions
+        }})
+    return responses
+
+
+def raw_transactions(blocks, txs_per_block=4, entries_per_tx=6, start_block=177896, seed=0):
+    """
+    EmpiricNetworkLoader.RAW_TRANSACTION_COLUMNS frame of `blocks` synthetic blocks
+    """
+    txs = []
+    for response in starknet_blocks(blocks, txs_per_block, entries_per_tx, oracle_share=1.0, start_block=start_block, seed=seed):
+        block = response['result']
+        txs.extend(dict(tx, timestamp=block['timestamp'], block_number=block['block_number']) for tx in block['transactions'])
+    return pd.DataFrame(txs)[['block_number', 'timestamp', 'transaction_hash', 'entry_point_selector', 'calldata']]
+
+
+def answer_updated_csvs(directory, events, contracts, files=10, start_block=14720259, start_time=1651795200, seed=0):
+    """
+    Writes ctc style AnswerUpdated event CSVs, `files` block ranges per contract.
+    Returns the paths written.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    per_contract = events // len(contracts)
+    paths = []
+    for contract in contracts:
+        blocks = start_block + np.sort(rng.integers(0, per_contract * 10, per_contract))
+        answers = np.cumprod(1 + rng.normal(0, 0.005, per_contract)) * 2000 * 10 ** 8
+        frame = pd.DataFrame({
+            'block_number': blocks,
+            'transaction_index': rng.integers(0, 200, per_contract),
+            'log_index': rng.integers(0, 400, per_contract),
+            'transaction_hash': [hex(int(value)) for value in rng.integers(1, 2 ** 62, per_contract)],
+            'contract_address': contract,
+            'event_name': 'AnswerUpdated',
+            'arg__current': answers.astype(np.int64),
+            'arg__roundId': np.arange(per_contract) + 1,
+            'arg__updatedAt': start_time + (blocks - start_block) * BLOCK_TIME,
+        })
+        for chunk in np.array_split(np.arange(per_contract), files):
+            if not len(chunk):
+                continue
+            part = frame.iloc[chunk]
+            path = os.path.join(
+                directory, f"{contract}__events__{part['block_number'].iloc[0]}_to_{part['block_number'].iloc[-1]}.csv"
+            )
+            part.to_csv(path, index=False)
+            paths.append(path)
+    return paths
+
+
+def tick_archive(directory, rows, rows_per_file=200000, pairs=ARCHIVE_PAIRS, publishers=ARCHIVE_PUBLISHERS,
+                 start=ARCHIVE_START, start_block=500000, seed=0):
+    """
+    Writes a Parquet tick archive shaped like data/historical_parquet: one
+    {first_block:010d}_{last_block:010d}.parquet file per `rows_per_file` rows,
+    prices as 8 decimal fixed point floats and timestamps as ISO strings.
+    Returns the paths written.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    base_prices = {pair: 10.0 ** rng.uniform(0, 4.7) for pair in pairs}
+    entries_per_block = len(pairs) * len(publishers)
+    paths = []
+    for first_row in range(0, rows, rows_per_file):
+        size = min(rows_per_file, rows - first_row)
+        row = np.arange(first_row, first_row + size)
+        block = start_block + row // entries_per_block
+        pair = np.asarray(pairs, dtype=object)[(row // len(publishers)) % len(pairs)]
+        publisher = np.asarray(publishers, dtype=object)[row % len(publishers)]
+        block_time = start + pd.to_timedelta((block - start_block) * BLOCK_TIME, unit='s')
+        entry_time = block_time - pd.to_timedelta(rng.integers(0, 60, size), unit='s')
+        drift = np.exp(np.sin((block - start_block) / 5000) * 0.1 + rng.normal(0, 0.001, size))
+        price = np.round(np.array([base_prices[name] for name in pair]) * drift * 10 ** 8)
+        table = pa.table({
+            'network': pa.array(['starknet-mainnet'] * size),
+            'pair_id': pa.array(pair, pa.string()),
+            'data_id': pa.array([f"{value:#066x}_0" for value in row]),
+            'block_hash': pa.array([f"{value:#066x}" for value in block]),
+            'block_number': pa.array(block, pa.int64()),
+            'block_timestamp': pa.array(block_time.strftime('%Y-%m-%dT%H:%M:%S+00:00')),
+            'transaction_hash': pa.array([f"{value:#066x}" for value in block * 7]),
+            'price': pa.array(price, pa.float64()),
+            'timestamp': pa.array(entry_time.strftime('%Y-%m-%dT%H:%M:%S.000Z')),
+            'publisher': pa.array(publisher, pa.string()),
+            'source': pa.array(publisher, pa.string()),
+            'volume': pa.array(['0x0'] * size),
+        })
+        path = os.path.join(directory, f"{block[0]:010d}_{block[-1]:010d}.parquet")
+        pq.write_table(table, path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,268 @@
+"""
+Benchmark suite
+
+Runs every stage on deterministic synthetic data and records its throughput and
+peak resident memory. Each stage runs in a fresh process so peak RSS is its own.
+Results are written as JSON to benchmarks/results/ (or --output) to be compared
+across commits:
+
+    python -m benchmarks.run --scale 1
+    python -m benchmarks.run --stages decode,deviation --baseline benchmarks/results/<previous>.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+ANALYTICS_DIR = os.path.join(REPOSITORY_DIR, 'analytics')
+RESULTS_DIR = os.path.join(REPOSITORY_DIR, 'benchmarks', 'results')
+ABI_FILE = os.path.join(REPOSITORY_DIR, 'src', 'abi', 'empiric_abi.json')
+
+# Sizes at scale 1, every stage multiplies them by --scale
+BLOCKS = 2000
+TXS_PER_BLOCK = 4
+ENTRIES_PER_TX = 6
+CHAINLINK_EVENTS = 50000
+ARCHIVE_ROWS = 500000
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def bench_filter_block(scale, workdir):
+    from benchmarks.generators import starknet_blocks
+    from src.crawler import BlockCrawler
+    responses = starknet_blocks(int(BLOCKS * scale), TXS_PER_BLOCK, ENTRIES_PER_TX, contract_address=1)
+    crawler = BlockCrawler(None, contract_address=1)
+
+    def run():
+        for response in responses:
+            crawler.filter_block(response['result']['block_number'], response)
+    return run, len(responses), 'blocks'
+
+
+def bench_data_parser(scale, workdir):
+    from benchmarks.generators import raw_transactions
+    from src.utils import DataParser
+    with open(ABI_FILE) as f:
+        abi = json.load(f)
+    function = next(item for item in abi if item.get('name') == 'submit_many_entries')
+    structs = [item for item in abi if item['type'] == 'struct']
+    calldatas = raw_transactions(int(BLOCKS * scale), TXS_PER_BLOCK, ENTRIES_PER_TX)['calldata'].tolist()
+
+    def run():
+        for calldata in calldatas:
+            DataParser('submit_many_entries', calldata, function['inputs'], structs)
+    return run, len(calldatas) * ENTRIES_PER_TX, 'entries'
+
+
+def bench_decode(scale, workdir):
+    from benchmarks.generators import raw_transactions
+    from src.decoder import CalldataDecoder
+    from src.utils import entries_table
+    raw = raw_transactions(int(BLOCKS * scale), TXS_PER_BLOCK, ENTRIES_PER_TX)
+    decoder = CalldataDecoder.from_file(ABI_FILE)
+
+    def run():
+        positions, columns = decoder.extract_struct_array(raw['entry_point_selector'], raw['calldata'], 'new_entries')
+        entries_table(positions, columns)
+    return run, len(raw) * ENTRIES_PER_TX, 'entries'
+
+
+def bench_format_feeds(scale, workdir):
+    from benchmarks.generators import raw_transactions
+    from src.feeds import feeds_for
+    from src.pipeline import EmpiricNetworkLoader
+    raw = raw_transactions(int(BLOCKS * scale), TXS_PER_BLOCK, ENTRIES_PER_TX)
+    # The loader is built without __init__ so no node or store is touched
+    loader = object.__new__(EmpiricNetworkLoader)
+    loader.EMPIRIC_ABI_FILE = ABI_FILE
+    loader.feeds = feeds_for('empiric', ['luna/eth', 'eth/usd', 'luna/usd'])
+
+    def run():
+        loader.raw_transactions = raw.copy()
+        loader._format_feeds()
+        loader.price_feeds
+    return run, len(raw), 'transactions'
+
+
+def bench_chainlink_sync(scale, workdir):
+    from benchmarks.generators import answer_updated_csvs
+    from src.store import ChainlinkEventStore
+    events_dir = os.path.join(workdir, 'events')
+    answer_updated_csvs(events_dir, int(CHAINLINK_EVENTS * scale), contracts=['0x' + '37' * 20, '0x' + 'a2' * 20])
+    store = ChainlinkEventStore(os.path.join(workdir, 'dbs', 'chainlink_events.db'), events_dir)
+    return store.sync, int(CHAINLINK_EVENTS * scale), 'events'
+
+
+def bench_chainlink_load(scale, workdir):
+    from benchmarks.generators import answer_updated_csvs
+    from src.feeds import feeds_for
+    from src.pipeline import ChainLinkLoader
+    from src.store import ChainlinkEventStore
+    events_dir = os.path.join(workdir, 'events')
+    answer_updated_csvs(events_dir, int(CHAINLINK_EVENTS * scale), contracts=['0x' + '37' * 20])
+    loader = object.__new__(ChainLinkLoader)
+    loader.ETH_ENDING_BLOCK = None
+    loader.feeds = {pair: dict(feed, chainlink_aggregators=['0x' + '37' * 20]) for pair, feed in feeds_for('chainlink', ['eth/usd']).items()}
+    loader.event_store = ChainlinkEventStore(os.path.join(workdir, 'dbs', 'chainlink_events.db'), events_dir)
+    loader.event_store.sync()
+
+    def run():
+        loader._load()
+        loader._format()
+        loader.price_feeds
+    return run, int(CHAINLINK_EVENTS * scale), 'events'
+
+
+def archive(scale, workdir):
+    from benchmarks.generators import tick_archive
+    directory = os.path.join(workdir, 'historical_parquet')
+    tick_archive(directory, int(ARCHIVE_ROWS * scale))
+    sys.path.insert(0, ANALYTICS_DIR)
+    return directory
+
+
+def bench_deviation(scale, workdir):
+    directory = archive(scale, workdir)
+    from deviation import deviation_report
+
+    def run():
+        deviation_report([0.25, 0.5, 1.0], parquet_directory=directory, processes=1)
+    return run, int(ARCHIVE_ROWS * scale), 'rows'
+
+
+def bench_stream_bars(scale, workdir):
+    directory = archive(scale, workdir)
+    from streaming_resample import resample_archive
+
+    def run():
+        resample_archive(directory, freq='1h')
+    return run, int(ARCHIVE_ROWS * scale), 'rows'
+
+
+def bench_trigger_simulator(scale, workdir):
+    directory = archive(scale, workdir)
+    from trigger_simulator import load_ticks, simulate_pair
+
+    def run():
+        ticks = load_ticks(directory)
+        for pair in ticks.pairs:
+            simulate_pair(ticks.select(pairs=[pair]), [(10, 600), (25, 3600), (100, 86400)])
+    return run, int(ARCHIVE_ROWS * scale), 'rows'
+
+
+STAGES = {
+    'filter_block': bench_filter_block,
+    'data_parser': bench_data_parser,
+    'decode': bench_decode,
+    'format_feeds': bench_format_feeds,
+    'chainlink_sync': bench_chainlink_sync,
+    'chainlink_load': bench_chainlink_load,
+    'deviation': bench_deviation,
+    'stream_bars': bench_stream_bars,
+    'trigger_simulator': bench_trigger_simulator,
+}
+
+
+def run_stage(name, scale, repeat):
+    """
+    Sets up and times one stage, in the worker process. The best of `repeat` runs is kept.
+    """
+    sys.path.insert(0, REPOSITORY_DIR)
+    with tempfile.TemporaryDirectory() as workdir:
+        run, items, unit = STAGES[name](scale, workdir)
+        setup_rss = peak_rss_mb()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    return {
+        'stage': name,
+        'items': items,
+        'unit': unit,
+        'seconds': seconds,
+        'throughput': items / seconds if seconds else None,
+        'setup_rss_mb': setup_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPOSITORY_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(stages=None, scale=1.0, repeat=3):
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for name in stages or STAGES:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_stage, name, scale, repeat).result()
+        print(f"{name:<20} {result['throughput']:>14,.0f} {result['unit']}/s {result['peak_rss_mb']:>9.1f} MB peak")
+        results.append(result)
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': scale,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(report, baseline):
+    previous = {result['stage']: result for result in baseline['results']}
+    for result in report['results']:
+        if result['stage'] in previous and previous[result['stage']]['throughput']:
+            speedup = result['throughput'] / previous[result['stage']]['throughput']
+            print(f"{result['stage']:<20} {speedup:>6.2f}x throughput vs {baseline.get('git_commit')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', help=f"comma separated subset of {', '.join(STAGES)}")
+    parser.add_argument('--output', help='result file, defaults to benchmarks/results/<time>_<commit>.json')
+    parser.add_argument('--baseline', help='previous result file to compare against')
+    args = parser.parse_args()
+
+    stages = args.stages.split(',') if args.stages else None
+    unknown = [name for name in stages or [] if name not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages {unknown}")
+    report = run_benchmarks(stages, args.scale, args.repeat)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['created_at'].replace(':', '')}_{report['git_commit'] or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
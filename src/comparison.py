@@ -0,0 +1,90 @@
+"""
+Oracle accuracy metrics against a reference series.
+
+Frames are the loaders' outputs: a `date` column (or index), a `price` column and
+a `feed` column naming the pair. A single pair frame without one needs its pair
+passed as `pair`. Everything is computed with as-of joins
+and grouped aggregations, so any number of oracles, pairs and windows go through
+the same few vectorized passes.
+"""
+import pandas as pd
+
+
+def prepare_feed(frame, pair=None):
+    if 'date' not in frame.columns:
+        frame = frame.reset_index()
+    if 'feed' not in frame.columns and pair is None:
+        # Defaulting would silently join feeds of different pairs
+        raise Exception("Feed has no `feed` column, pass the pair it prices as `pair`")
+    return pd.DataFrame({
+        'pair': frame['feed'].astype(str) if 'feed' in frame.columns else pair,
+        # Naive dates are taken as UTC, tz-aware ones are converted to it
+        'date': pd.to_datetime(frame['date'], utc=True).dt.tz_localize(None).astype('datetime64[ns]'),
+        'price': pd.to_numeric(frame['price']).astype(float),
+    }).dropna(subset=['price']).sort_values(by=['date'], kind='stable').reset_index(drop=True)
+
+
+def align_feeds(reference, oracles, tolerance='1h', pair=None):
+    """
+    As-of joins every oracle onto the reference timestamps, per pair. `pair` names the
+    pair of frames without a `feed` column.
+
+    For each reference point and oracle, `oracle_date` is the oracle's latest update at
+    or before it and `next_update_date` the first update at or after it. `price` is the
+    latest update's price when it is no older than `tolerance`, NaN otherwise, so only
+    deviation ignores stale prices. Returns one long frame with deviation, staleness_s
+    (age of the latest update, however old) and update_lag_s (wait until the oracle next updates).
+    """
+    reference = prepare_feed(reference, pair).rename(columns={'price': 'reference_price'})
+    tolerance = pd.Timedelta(tolerance) if tolerance is not None else None
+    aligned = []
+    for name, oracle in oracles.items():
+        oracle = prepare_feed(oracle, pair).rename(columns={'date': 'oracle_date'})
+        joined = pd.merge_asof(
+            reference, oracle, left_on='date', right_on='oracle_date', by='pair', direction='backward'
+        )
+        if tolerance is not None:
+            joined.loc[joined['date'] - joined['oracle_date'] > tolerance, 'price'] = float('nan')
+        next_updates = oracle[['pair', 'oracle_date']].rename(columns={'oracle_date': 'next_update_date'})
+        joined = pd.merge_asof(
+            joined, next_updates, left_on='date', right_on='next_update_date', by='pair', direction='forward'
+        )
+        aligned.append(joined.assign(oracle=name))
+    aligned = pd.concat(aligned, ignore_index=True)
+    aligned['deviation'] = aligned['price'] / aligned['reference_price'] - 1
+    aligned['staleness_s'] = (aligned['date'] - aligned['oracle_date']).dt.total_seconds()
+    aligned['update_lag_s'] = (aligned['next_update_date'] - aligned['date']).dt.total_seconds()
+    return aligned[[
+        'oracle', 'pair', 'date', 'reference_price', 'price', 'oracle_date', 'next_update_date',
+        'deviation', 'staleness_s', 'update_lag_s'
+    ]]
+
+
+def scorecard(aligned, window=None):
+    """
+    Aggregates align_feeds output per oracle and pair, and per `window` (e.g. '1D') when given
+    """
+    keys = ['oracle', 'pair'] + ([pd.Grouper(key='date', freq=window)] if window else [])
+    aligned = aligned.assign(
+        deviation_bps=aligned['deviation'] * 10 ** 4,
+        abs_deviation_bps=aligned['deviation'].abs() * 10 ** 4,
+    )
+    card = aligned.groupby(keys).agg(
+        samples=('reference_price', 'size'),
+        matched=('price', 'count'),
+        updates=('oracle_date', 'nunique'),
+        mean_deviation_bps=('deviation_bps', 'mean'),
+        mean_abs_deviation_bps=('abs_deviation_bps', 'mean'),
+        max_abs_deviation_bps=('abs_deviation_bps', 'max'),
+        tracking_error_bps=('deviation_bps', 'std'),
+        mean_staleness_s=('staleness_s', 'mean'),
+        max_staleness_s=('staleness_s', 'max'),
+        mean_update_lag_s=('update_lag_s', 'mean'),
+        max_update_lag_s=('update_lag_s', 'max'),
+    )
+    card['coverage'] = card['matched'] / card['samples']
+    return card
+
+
+def compare(reference, oracles, tolerance='1h', window=None, pair=None):
+    return scorecard(align_feeds(reference, oracles, tolerance, pair), window)
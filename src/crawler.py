@@ -0,0 +1,65 @@
+from src.instrumentation import METRICS
+from src.node import run_sync
+from src.utils import hex_string_to_decimal
+import pandas as pd
+import asyncio
+
+
+class BlockCrawler:
+    """
+    Range-sharded StarkNet block crawler
+
+    Splits [start_block, end_block) into shards that are fetched concurrently
+    through an AsyncNodeRequester, each shard pulling its blocks through JSON-RPC
+    batches of `batch_size`. Parallelism is bounded by the requester's concurrency
+    limit. Matching transactions are kept as plain dicts and merged into a single
+    DataFrame once every shard is done.
+    """
+
+    SHARD_SIZE = 1000
+    BATCH_SIZE = 50
+
+    def __init__(self, requester, contract_address, shard_size=SHARD_SIZE, batch_size=BATCH_SIZE):
+        self.requester = requester
+        self.contract_address = contract_address
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+
+    def shards(self, start_block, end_block):
+        return [
+            (shard_start, min(shard_start + self.shard_size, end_block))
+            for shard_start in range(start_block, end_block, self.shard_size)
+        ]
+
+    def crawl(self, start_block, end_block):
+        return run_sync(self.async_crawl(start_block, end_block))
+
+    async def async_crawl(self, start_block, end_block):
+        with METRICS.stage('crawler.crawl'):
+            async with self.requester:
+                results = await asyncio.gather(*[self.fetch_shard(*shard) for shard in self.shards(start_block, end_block)])
+        txs = [tx for shard_txs in results for tx in shard_txs]
+        return pd.DataFrame(txs)
+
+    async def fetch_shard(self, start_block, end_block):
+        txs = []
+        for batch_start in range(start_block, end_block, self.batch_size):
+            block_numbers = range(batch_start, min(batch_start + self.batch_size, end_block))
+            responses = await self.requester.post_batch(
+                "", method="starknet_getBlockWithTxs", params_list=[[{"block_number": n}] for n in block_numbers]
+            )
+            for block_number, response in zip(block_numbers, responses):
+                txs.extend(self.filter_block(block_number, response))
+            METRICS.increment('crawler_blocks_total', len(block_numbers))
+        METRICS.increment('crawler_transactions_total', len(txs))
+        return txs
+
+    def filter_block(self, block_number, response):
+        if 'error' in response:
+            raise Exception(f"Failed to fetch block {block_number}: {response['error']}")
+        block = response["result"]
+        return [
+            dict(tx, timestamp=block['timestamp'], block_number=block_number)
+            for tx in block['transactions']
+            if hex_string_to_decimal(tx.get('contract_address', '0x0')) == self.contract_address
+        ]
@@ -0,0 +1,79 @@
+from src.utils import get_selector_from_name, compile_members, decode_members
+import json
+
+
+class CalldataDecoder:
+    """
+    Cairo ABI calldata decoder
+
+    Every function of the ABI is compiled once into a decode plan keyed by its
+    selector; decoding then walks the calldata with an index cursor, so a decode
+    is linear in the calldata length and struct lookups happen at compile time.
+    """
+
+    def __init__(self, abi):
+        structs = {struct['name']: struct for struct in abi if struct['type'] == "struct"}
+        self.functions = {
+            get_selector_from_name(func['name']): (func['name'], compile_members(func['inputs'], structs))
+            for func in abi if func['type'] == "function"
+        }
+        self.selectors = {}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as f:
+            return cls(json.loads(f.read()))
+
+    def selector(self, entry_point_selector):
+        # Selectors come in as hex strings with varying zero padding, parse each distinct one once
+        if entry_point_selector not in self.selectors:
+            self.selectors[entry_point_selector] = int(entry_point_selector, 16) if isinstance(entry_point_selector, str) else int(entry_point_selector)
+        return self.selectors[entry_point_selector]
+
+    def function_name(self, entry_point_selector):
+        function = self.functions.get(self.selector(entry_point_selector))
+        return function[0] if function else None
+
+    def decode(self, entry_point_selector, calldata):
+        """
+        Returns the {input name: value} dict of one call, or None for selectors outside the ABI
+        """
+        function = self.functions.get(self.selector(entry_point_selector))
+        if function is None:
+            return None
+        values, _ = decode_members(function[1], calldata)
+        return values
+
+    def decode_batch(self, entry_point_selectors, calldatas):
+        return [
+            self.decode(entry_point_selector, calldata)
+            for entry_point_selector, calldata in zip(entry_point_selectors, calldatas)
+        ]
+
+    def extract_struct_array(self, entry_point_selectors, calldatas, name):
+        """
+        Pulls the felt-only struct array input `name` out of every call that has it,
+        column by column. Returns the position of the call each element came from
+        and a {member: [raw felts]} dict, without building a dict per element.
+        """
+        positions = []
+        columns = None
+        for position, (entry_point_selector, calldata) in enumerate(zip(entry_point_selectors, calldatas)):
+            function = self.functions.get(self.selector(entry_point_selector))
+            if function is None:
+                continue
+            plan = function[1]
+            index = next((i for i, member in enumerate(plan) if member[0] == name), None)
+            if index is None:
+                continue
+            members = plan[index][3]
+            if columns is None:
+                columns = {member: [] for member in members}
+            _, cursor = decode_members(plan[:index], calldata)
+            length = int(calldata[cursor], 16)
+            width = len(members)
+            values = calldata[cursor+1:cursor+1+length*width]
+            for offset, member in enumerate(members):
+                columns[member].extend(values[offset::width])
+            positions.extend([position] * length)
+        return positions, columns or {}
@@ -0,0 +1,43 @@
+"""
+Feed registry: how each benchmarked pair is read from every source.
+
+- empiric: (base, quote) Empiric keys, the pair price is base / quote within each
+  submission; quote is None when Empiric publishes the pair directly
+- empiric_decimals: fixed point decimals of direct Empiric prices
+- chainlink: Ethereum mainnet feed proxy address, chainlink_decimals its answer decimals,
+  chainlink_aggregators optionally the aggregators behind it when ctc hasn't recorded them
+- kaiko: Kaiko base/quote path
+"""
+
+FEEDS = {
+    'luna/eth': {
+        'empiric': ('luna/usd', 'eth/usd'),
+        'chainlink': '0x91e9331556ed76c9393055719986409e11b56f73',
+        'chainlink_decimals': 18,
+        'kaiko': 'luna/eth',
+    },
+    'luna/usd': {
+        'empiric': ('luna/usd', None),
+        'empiric_decimals': 18,
+        'kaiko': 'luna/usd',
+    },
+    'eth/usd': {
+        'empiric': ('eth/usd', None),
+        'empiric_decimals': 18,
+        'chainlink': '0x5f4ec3df9cbd43714fe2740f5e3616155c5b8419',
+        'chainlink_decimals': 8,
+        'kaiko': 'eth/usd',
+    },
+}
+
+DEFAULT_PAIRS = ['luna/eth']
+
+
+def feeds_for(source, pairs):
+    """
+    Returns {pair: registry entry} for the pairs that `source` can serve
+    """
+    unknown = [pair for pair in pairs if pair not in FEEDS]
+    if unknown:
+        raise Exception(f"Unknown pairs {unknown}, add them to src.feeds.FEEDS")
+    return {pair: FEEDS[pair] for pair in pairs if FEEDS[pair].get(source)}
@@ -0,0 +1,110 @@
+"""
+Bulk felt decoding.
+
+Hex felt columns are converted to integers in bulk: the strings are joined into one
+buffer, mapped to nibbles through a lookup table and folded into uint64 words with
+numpy, instead of calling int(value, 16) on every element. Short strings (pair ids,
+publishers, sources) only take a few dozen distinct values, so they are decoded once
+per distinct value and broadcast back as categoricals.
+
+Only numpy and pandas are needed, so the analytics scripts can use it as well.
+"""
+import numpy as np
+import pandas as pd
+
+WORD_DIGITS = 16
+
+# Nibble value of every ASCII byte; padding and the '0x' prefix count as 0
+NIBBLES = np.zeros(256, dtype=np.uint8)
+for digit in b'0123456789':
+    NIBBLES[digit] = digit - ord('0')
+for digit in b'abcdef':
+    NIBBLES[digit] = NIBBLES[digit - 32] = digit - ord('a') + 10
+
+
+def hex_words(felts, words=None):
+    """
+    Big endian uint64 words of every hex felt, shape (len(felts), words).
+    `words` defaults to the fewest words holding the longest felt.
+
+    The felts are joined into one byte buffer and mapped to nibbles. Felts of the same
+    length (a column usually has a handful of lengths) are gathered into a matrix and
+    folded column by column, Horner style, one uint64 word at a time.
+    """
+    felts = felts.tolist() if isinstance(felts, (np.ndarray, pd.Series, pd.Index)) else list(felts)
+    lengths = np.fromiter(map(len, felts), dtype=np.int64, count=len(felts))
+    if words is None:
+        words = max(-(-int(lengths.max(initial=0)) // WORD_DIGITS), 1)
+    result = np.zeros((len(felts), words), dtype=np.uint64)
+    nibbles = NIBBLES[np.frombuffer(''.join(felts).encode('ascii'), dtype=np.uint8)]
+    starts = np.cumsum(lengths) - lengths
+    uniform = len(felts) > 0 and lengths.min() == lengths.max()
+    for length in ([lengths[0]] if uniform else np.unique(lengths)):
+        if uniform:
+            rows, digits = slice(None), nibbles.reshape(len(felts), length)
+        else:
+            rows = np.flatnonzero(lengths == length)
+            digits = nibbles[starts[rows][:, None] + np.arange(length)[None, :]]
+        # Column major so every Horner step reads one contiguous digit column
+        digits = np.ascontiguousarray(digits.T)
+        for word in range(words):
+            # Digits of this word, most significant first
+            first, last = max(length - (word + 1) * WORD_DIGITS, 0), length - word * WORD_DIGITS
+            if last <= 0:
+                break
+            value = np.zeros(digits.shape[1], dtype=np.uint64)
+            for column in range(first, last):
+                value <<= np.uint64(4)
+                value |= digits[column]
+            result[rows, words - 1 - word] = value
+    return result
+
+
+def felts_to_int(felts, dtype=np.int64):
+    """
+    Hex felts to an array of `dtype`, whatever the values, so every part of a column gets
+    the same type. int64 columns are converted in bulk and raise OverflowError when a felt
+    doesn't fit. object columns (hashes, 18 decimal prices) hold Python ints parsed with
+    int(), the bulk path would only split them into words to parse them again.
+    """
+    if dtype == object:
+        return np.array([int(value, 16) for value in felts], dtype=object)
+    if len(felts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    words = hex_words(felts)
+    if words[:, :-1].any() or words[:, -1].max() > np.iinfo(np.int64).max:
+        raise OverflowError("Felts wider than int64, convert them with dtype=object")
+    return words[:, -1].astype(np.int64)
+
+
+def felts_to_float(felts):
+    """
+    Hex felts to float64. Felts wider than 64 bits (18 decimal prices) go through
+    Python ints so that they are rounded exactly once.
+    """
+    if len(felts) == 0:
+        return np.zeros(0, dtype=np.float64)
+    words = hex_words(felts)
+    if words[:, :-1].any():
+        return np.array([float(int(value, 16)) for value in felts])
+    return words[:, -1].astype(np.float64)
+
+
+def felt_to_string(felt):
+    """
+    Short string of one felt, given as an int or a hex string
+    """
+    value = int(felt) if isinstance(felt, (int, np.integer)) else int(felt, 16)
+    return value.to_bytes((value.bit_length() + 7) // 8, 'big').decode('utf-8')
+
+
+def decode_short_strings(felts):
+    """
+    Short string felts (hex strings or ints) to a Categorical, decoding each distinct value once
+    """
+    codes, uniques = pd.factorize(np.asarray(felts, dtype=object))
+    labels = [felt_to_string(felt) for felt in uniques]
+    if len(set(labels)) < len(labels):
+        # Differently padded spellings of the same felt
+        return pd.Categorical(np.asarray(labels, dtype=object)[codes])
+    return pd.Categorical.from_codes(codes, labels)
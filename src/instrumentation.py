@@ -0,0 +1,209 @@
+"""
+Run instrumentation: stage timers, counters and histograms.
+
+Everything records into the process wide METRICS registry, which can be exported as
+a JSON run report or a Prometheus text file (node_exporter textfile collector format):
+
+    with METRICS.stage('empiric.decode'):
+        ...
+    METRICS.increment('decoder_entries_total', len(entries))
+    METRICS.write_json('run_report.json')
+    METRICS.write_prometheus('oracle_benchmark.prom')
+
+Scripts call export_metrics at the end of a run, which writes both files to
+$METRICS_DIR when it is set.
+
+Only the standard library is used so the analytics scripts can record into it too.
+"""
+from contextlib import contextmanager
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# Upper bounds in seconds, suited to RPC latencies and pipeline stages alike
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    """
+    Cumulative bucket counts plus count, sum, min and max of the observed values
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self):
+        return {
+            'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'buckets': dict(zip([str(bound) for bound in self.buckets], self.counts)),
+        }
+
+
+class Metrics:
+    """
+    Thread safe registry of counters, gauges and histograms, each keyed by name and labels
+    """
+
+    PROMETHEUS_PREFIX = 'oracle_benchmark_'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.time()
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        with self.lock:
+            key = (name, label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, label_key(labels))] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        with self.lock:
+            key = (name, label_key(labels))
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the duration of the block, in seconds, into histogram `name`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage):
+        return self.timer('stage_seconds', stage=stage)
+
+    def timed(self, stage):
+        """
+        Decorator timing every call of a function as `stage`
+        """
+        def decorator(function):
+            def wrapper(*args, **kwargs):
+                with self.stage(stage):
+                    return function(*args, **kwargs)
+            wrapper.__name__, wrapper.__doc__ = function.__name__, function.__doc__
+            return wrapper
+        return decorator
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, label_key(labels)), 0)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get((name, label_key(labels)))
+
+    def report(self):
+        """
+        JSON serializable snapshot of the run
+        """
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'elapsed_s': time.time() - self.started_at,
+                'peak_rss_bytes': peak_rss,
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self.counters.items())],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self.gauges.items())],
+                'histograms': [
+                    dict(histogram.to_dict(), name=name, labels=dict(labels))
+                    for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])
+                ],
+            }
+
+    def to_prometheus(self):
+        prefix = self.PROMETHEUS_PREFIX
+        lines = []
+        with self.lock:
+            for kind, metrics in [('counter', self.counters), ('gauge', self.gauges)]:
+                for name in sorted({name for name, _ in metrics}):
+                    lines.append(f'# TYPE {prefix}{name} {kind}')
+                    lines.extend(
+                        f'{prefix}{name}{format_labels(dict(labels))} {value}'
+                        for (metric, labels), value in sorted(metrics.items()) if metric == name
+                    )
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {prefix}{name} histogram')
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    labels = dict(labels)
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{prefix}{name}_bucket{format_labels(labels, le=bound)} {count}')
+                    lines.append(f'{prefix}{name}_bucket{format_labels(labels, le="+Inf")} {histogram.count}')
+                    lines.append(f'{prefix}{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{prefix}{name}_count{format_labels(labels)} {histogram.count}')
+        lines.append(f'# TYPE {prefix}run_elapsed_seconds gauge')
+        lines.append(f'{prefix}run_elapsed_seconds {time.time() - self.started_at}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _write(path, text):
+        # Written aside and moved in place so a scraper never reads a partial file
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(f'{path}.tmp', 'w') as f:
+            f.write(text)
+        os.replace(f'{path}.tmp', path)
+
+    def write_json(self, path):
+        self._write(path, json.dumps(self.report(), indent=2, default=float))
+
+    def write_prometheus(self, path):
+        self._write(path, self.to_prometheus())
+
+
+METRICS = Metrics()
+
+
+def export_metrics(name, directory=None):
+    """
+    Writes `<name>.json` and `<name>.prom` to `directory` (default $METRICS_DIR), if any
+    """
+    directory = directory or os.environ.get('METRICS_DIR')
+    if not directory:
+        return
+    METRICS.write_json(os.path.join(directory, f'{name}.json'))
+    METRICS.write_prometheus(os.path.join(directory, f'{name}.prom'))
@@ -1,6 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+from src.instrumentation import METRICS
 import os
 import requests
 import json
+import time
+import asyncio
+import aiohttp
+
+
+def order_batch_responses(responses, size):
+    """
+    Responses of a JSON-RPC batch of `size` requests (ids 0 to size - 1), in request order.
+    Nodes may answer in any order. A reply without a usable id (an error with "id": null)
+    or a missing id raises, so no response is ever paired with the wrong request.
+    """
+    if isinstance(responses, dict):
+        # Some nodes answer a whole batch with a single error object
+        return [responses] * size
+    by_id = {response.get('id'): response for response in responses}
+    missing = [request_id for request_id in range(size) if request_id not in by_id]
+    if missing:
+        errors = [response.get('error') for response in responses if response.get('id') not in range(size)]
+        raise Exception(f"JSON-RPC batch answered without ids {missing[:10]}{'...' if len(missing) > 10 else ''} of {size}: {errors[:3]}")
+    return [by_id[request_id] for request_id in range(size)]
 
 
 class NodeRequester:
@@ -17,22 +39,42 @@ class NodeRequester:
         self.headers = {"Content-Type": "application/json"}
         self.base_request_data = {"jsonrpc":"2.0", "id":1, "method":"", "params":[]}
         
-    def get_request_data(self, method, params):
-        request_data = self.base_request_data
-        request_data["method"] = method
-        request_data["params"] = params
-        return json.dumps(request_data)
+    def get_request_data(self, method, params, request_id=1):
+        request_data = dict(self.base_request_data, id=request_id, method=method, params=params)
+        return request_data
     
     def get(self, url, **kwargs):
-        return self.session.get(self.base_url+url, **kwargs)
+        with METRICS.timer('node_request_seconds', client='sync', verb='GET'):
+            response = self.session.get(self.base_url+url, **kwargs)
+        self.record(response)
+        return response
 
     def post(self, url, method=None, params=None, **kwargs):
         if self.base_url == os.environ.get("STARKNET_NODE_URL"):
-            data = self.get_request_data(method, params)
+            data = json.dumps(self.get_request_data(method, params))
         else:
             data = json.dumps(params)
         
-        return self.session.post(self.base_url+url, data=data, headers=self.headers, **kwargs)
+        with METRICS.timer('node_request_seconds', client='sync', verb='POST'):
+            response = self.session.post(self.base_url+url, data=data, headers=self.headers, **kwargs)
+        self.record(response)
+        return response
+
+    def post_batch(self, url, method, params_list, **kwargs):
+        """
+        Sends one JSON-RPC batch request, results are returned in the order of params_list
+        """
+        data = json.dumps([self.get_request_data(method, params, request_id) for request_id, params in enumerate(params_list)])
+        with METRICS.timer('node_request_seconds', client='sync', verb='POST'):
+            r = self.session.post(self.base_url+url, data=data, headers=self.headers, **kwargs)
+        self.record(r)
+        METRICS.increment('node_rpc_calls_total', len(params_list), method=method)
+        return order_batch_responses(json.loads(r.text), len(params_list))
+
+    @staticmethod
+    def record(response):
+        METRICS.increment('node_requests_total', client='sync', status=response.status_code)
+        METRICS.increment('node_response_bytes_total', len(response.content), client='sync')
 
     @staticmethod
     def __deep_merge(source, destination):
@@ -43,3 +85,126 @@ class NodeRequester:
             else:
                 destination[key] = value
         return destination
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: `rate` requests per second, bursts up to `capacity`
+    (at least one request, so rates below one per second still make progress)
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # Created by acquire on the event loop that uses the bucket, and again if it is
+        # reused from another loop (each run_sync call runs its own)
+        self.lock = None
+        self.loop = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.lock, self.loop = asyncio.Lock(), loop
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncNodeRequester:
+    """
+    Asyncio Node Requester module
+
+    Pooled aiohttp counterpart of NodeRequester: at most `max_concurrency` requests
+    in flight, optional token bucket rate limiting and exponential backoff on 429/5xx.
+    Use it as an async context manager so the underlying session is closed.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url, headers=None, max_concurrency=32, rate_limit=None, max_retries=5, backoff_factor=0.5, timeout=60):
+        self.base_url = base_url or ""
+        # requests drops None headers, aiohttp refuses them
+        self.headers = {key: value for key, value in {"Content-Type": "application/json", **(headers or {})}.items() if value is not None}
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit_per_host=self.max_concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, headers=self.headers, timeout=self.timeout)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def get_request_data(self, method, params, request_id=1):
+        return {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, method=None, params=None, **kwargs):
+        data = self.get_request_data(method, params) if method is not None else params
+        return await self.request("POST", url, json=data, **kwargs)
+
+    async def post_batch(self, url, method, params_list, **kwargs):
+        """
+        Sends one JSON-RPC batch request, results are returned in the order of params_list
+        """
+        data = [self.get_request_data(method, params, request_id) for request_id, params in enumerate(params_list)]
+        responses = await self.request("POST", url, json=data, **kwargs)
+        METRICS.increment('node_rpc_calls_total', len(params_list), method=method)
+        return order_batch_responses(responses, len(params_list))
+
+    async def request(self, verb, url, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            try:
+                async with self.semaphore:
+                    start = time.perf_counter()
+                    async with self.session.request(verb, self.base_url+url, **kwargs) as response:
+                        METRICS.increment('node_requests_total', client='async', status=response.status)
+                        if response.status not in self.RETRY_STATUSES:
+                            response.raise_for_status()
+                            body = await response.read()
+                            METRICS.observe('node_request_seconds', time.perf_counter() - start, client='async', verb=verb)
+                            METRICS.increment('node_response_bytes_total', len(body), client='async')
+                            return json.loads(body) if body.strip() else None
+                        retry_after = response.headers.get("Retry-After")
+                        error = f"HTTP {response.status}"
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                METRICS.increment('node_request_errors_total', client='async', error=type(e).__name__)
+                retry_after, error = None, repr(e)
+            if attempt == self.max_retries:
+                break
+            METRICS.increment('node_request_retries_total', client='async')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff_factor * 2 ** attempt
+            await asyncio.sleep(delay)
+        raise Exception(f"{verb} {self.base_url+url} failed after {self.max_retries + 1} attempts: {error}")
+
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine to completion from synchronous code, including from inside
+    an already running event loop (e.g. a Jupyter notebook)
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
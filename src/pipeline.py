@@ -1,181 +1,326 @@
-from src.node import NodeRequester
-from src.utils import get_selector_from_name, hex_string_to_decimal, DataParser, normalize_submit_many_entry, combine_pair
+from src.node import NodeRequester, AsyncNodeRequester, run_sync
+from src.crawler import BlockCrawler
+from src.store import RawTransactionStore, ChainlinkEventStore, ResponseCache
+from src.decoder import CalldataDecoder
+from src.feeds import DEFAULT_PAIRS, feeds_for
+from src.ticks import TickArray
+from src.instrumentation import METRICS
+from src.utils import hex_string_to_decimal, entries_table, combine_pair_table, direct_pair_table
 from ctc.protocols import chainlink_utils
 from ctc.config import get_data_dir
-from os.path import exists
-from statistics import median
 import pandas as pd
+import asyncio
 import os
-import json
-import time
 
 
 class EmpiricNetworkLoader:
     """
     Empiric Network DataLoader
+
+    Every pair in `pairs` is extracted from the same decoded entries table,
+    so the block scan and decoding are done once whatever the number of pairs.
+    Prices are kept as a TickArray, `price_feeds` is its DataFrame view built on first access.
     """
 
     STARKNET_STARTING_BLOCK = 177896
     STARKNET_ENDING_BLOCK = 210236
     EMPIRIC_CONTRACT_ADDRESS = hex_string_to_decimal("0x4a05a68317edb37d34d29f34193829d7363d51a37068f32b142c637e43b47a2")
-    EMPIRIC_DATA_FILE = 'data/empiric_txs.csv'
+    EMPIRIC_DATA_DIR = 'data/empiric_txs'
+    EMPIRIC_ABI_FILE = 'src/abi/empiric_abi.json'
+    RAW_TRANSACTION_COLUMNS = ['block_number', 'timestamp', 'transaction_hash', 'entry_point_selector', 'calldata']
+    EMPIRIC_DECIMALS = 18
 
-    def __init__(self):
+    def __init__(self, pairs=DEFAULT_PAIRS):
+        self.feeds = feeds_for('empiric', pairs)
         self.sequencer_requester = NodeRequester(os.environ.get('STARKNET_SEQUENCER_URL'))
         self.node_requester = NodeRequester(os.environ.get('STARKNET_NODE_URL'))
         self.raw_transactions = pd.DataFrame()
-        self.price_feeds = pd.DataFrame()
-        file_exists = exists(self.EMPIRIC_DATA_FILE)
-        if file_exists:
-            self._load()
+        self.entries = pd.DataFrame()
+        self.ticks = TickArray.empty()
+        self._price_feeds = None
+        self.store = RawTransactionStore(self.EMPIRIC_DATA_DIR)
+        if self.store.exists():
+            with METRICS.stage('empiric.load'):
+                self._load()
         else:
-            self._initialize()
-        self._format_feeds()
+            with METRICS.stage('empiric.initialize'):
+                self._initialize()
+        with METRICS.stage('empiric.format_feeds'):
+            self._format_feeds()
 
     def _initialize(self):
-        for block_number in range(self.STARKNET_STARTING_BLOCK, self.STARKNET_ENDING_BLOCK):
-            params = {
-                "block_number": block_number
-            }
-            r = self.node_requester.post("", method="starknet_getBlockWithTxs", params=[params])
-            data = json.loads(r.text)
-            if 'error'in data:
-                return data['error']
-            data = data["result"]
-            list_txs = list(filter(
-                lambda tx: hex_string_to_decimal(tx['contract_address']) == self.EMPIRIC_CONTRACT_ADDRESS, 
-                data['transactions']
-            ))
-            timestamp = data['timestamp']
-            if list_txs:
-                new_df = pd.DataFrame(list_txs)
-                new_df['timestamp'] = timestamp
-                self.raw_transactions = pd.concat([self.transactions, new_df], ignore_index=True)
-        self.raw_transactions.to_csv(self.EMPIRIC_DATA_FILE)
+        crawler = BlockCrawler(AsyncNodeRequester(os.environ.get('STARKNET_NODE_URL')), self.EMPIRIC_CONTRACT_ADDRESS)
+        self.raw_transactions = crawler.crawl(self.STARKNET_STARTING_BLOCK, self.STARKNET_ENDING_BLOCK)
+        self.store.write(self.raw_transactions)
+        # A crawl that found no transactions has no columns at all
+        self.raw_transactions = self.raw_transactions.reindex(columns=self.RAW_TRANSACTION_COLUMNS)
 
     def _load(self):
-        self.raw_transactions = pd.read_csv(self.EMPIRIC_DATA_FILE, index_col=0)
+        self.raw_transactions = self.store.read(
+            columns=self.RAW_TRANSACTION_COLUMNS,
+            start_block=self.STARKNET_STARTING_BLOCK,
+            end_block=self.STARKNET_ENDING_BLOCK
+        )
 
     def _format_feeds(self):
-        abi = None
-        with open('src/abi/empiric_abi.json', 'r+') as f:
-            abi = json.loads(f.read())
-        struct_abi = list(filter(lambda x: x['type'] == "struct", abi))
-        functions_abi = list(filter(lambda x: x['type'] == "function", abi))
-        functions_abi = [dict(func, **{'keys': [get_selector_from_name(func['name'])]}) for func in functions_abi]
-
-        self.raw_transactions['function_info'] = self.raw_transactions.apply(
-            lambda row: list(filter(lambda x: x['keys'][0] == int(row['entry_point_selector'], 16), functions_abi))[0], 
-            axis=1
-        )
-        self.raw_transactions['calldata'] = self.raw_transactions.apply(
-            lambda row: eval(row['calldata']),
-            axis=1
-        )
-        self.raw_transactions['parsed_calldata'] = self.raw_transactions.apply(
-            lambda row: DataParser(row['function_info']['name'], row['calldata'], row['function_info']['inputs'], struct_abi),
-            axis=1
-        )
-        self.price_feeds = self.raw_transactions[["parsed_calldata", "timestamp"]]
-        self.price_feeds['normalized_entry'] = self.price_feeds.apply(
-            lambda row: normalize_submit_many_entry(row['parsed_calldata'].data),
-            axis=1
-        )
-        self.price_feeds.dropna(subset=['normalized_entry'], inplace=True)
-        self.price_feeds['price'] = self.price_feeds.apply(
-            lambda row: median(combine_pair(row['normalized_entry'])),
-            axis=1
-        )
-        self.price_feeds['feed'] = 'luna/eth'
-        self.price_feeds = self.price_feeds[['timestamp', 'price', 'feed']]
-        self.price_feeds['date'] = pd.to_datetime(self.price_feeds['timestamp'], unit='s')
+        decoder = CalldataDecoder.from_file(self.EMPIRIC_ABI_FILE)
+        with METRICS.stage('empiric.decode'):
+            self.raw_transactions['function'] = [
+                decoder.function_name(selector) for selector in self.raw_transactions['entry_point_selector']
+            ]
+            positions, columns = decoder.extract_struct_array(
+                self.raw_transactions['entry_point_selector'], self.raw_transactions['calldata'], 'new_entries'
+            )
+        with METRICS.stage('empiric.entries_table'):
+            self.entries = entries_table(positions, columns)
+        METRICS.increment('decoder_transactions_total', len(self.raw_transactions))
+        METRICS.increment('decoder_entries_total', len(self.entries))
+        pair_feeds = []
+        for pair, feed in self.feeds.items():
+            base_feed, quote_feed = feed['empiric']
+            if quote_feed is None:
+                pair_prices = direct_pair_table(self.entries, base_feed, feed['empiric_decimals'])
+            else:
+                with METRICS.stage('empiric.combine_pair'):
+                    pair_prices = combine_pair_table(self.entries, base_feed, quote_feed)
+            pair_feeds.append(TickArray.from_prices(
+                pair,
+                pair_prices.to_numpy(),
+                self.raw_transactions['timestamp'].to_numpy()[pair_prices.index.to_numpy()],
+                decimals=feed.get('empiric_decimals', self.EMPIRIC_DECIMALS),
+                sources='empiric'
+            ))
+        self.ticks = TickArray.concat(pair_feeds)
+        self._price_feeds = None
+        METRICS.increment('loader_ticks_total', len(self.ticks), source='empiric')
+
+    @property
+    def price_feeds(self):
+        if self._price_feeds is None:
+            self._price_feeds = self.ticks.to_frame(pair_column='feed')
+        return self._price_feeds
+
+    @price_feeds.setter
+    def price_feeds(self, frame):
+        self._price_feeds = frame
+
+    def get_feed(self, pair):
+        return self.price_feeds[self.price_feeds['feed'] == pair]
 
 
 class ChainLinkLoader:
     """
     ChainLink DataLoader
+
+    Events of every configured feed are fetched concurrently, read back in a single
+    store query and fanned out per pair through the `feed` column. Answers are kept
+    as a TickArray at each feed's decimals, `price_feeds` is built on first access.
     """
 
     ETH_STARTING_BLOCK = 14720259
     ETH_ENDING_BLOCK = 14850893
 
-    CHAINLINK_LUNA_FEED = "0x91e9331556ed76c9393055719986409e11b56f73"
-    #CHAINLINK_ETH_FEED = "0x5f4ec3df9cbd43714fe2740f5e3616155c5b8419"
     CHAINLINK_DATA_DIR = f'{get_data_dir()}/evm/networks/mainnet/events'
+    CHAINLINK_EVENTS_DB = f'{get_data_dir()}/dbs/chainlink_events.db'
+    CTC_DB = f'{get_data_dir()}/dbs/ctc.db'
 
     async def __new__(cls, *a, **kw):
         instance = super().__new__(cls)
         await instance.__init__(*a, **kw)
         return instance
 
-    async def __init__(self):
-        self.price_feeds = pd.DataFrame()
+    async def __init__(self, pairs=DEFAULT_PAIRS):
+        self.feeds = feeds_for('chainlink', pairs)
+        self.ticks = TickArray.empty()
+        self._price_feeds = None
         self.raw_transactions = pd.DataFrame()
-        self._load()
-        if self.raw_transactions.empty:
-            await self._initialize()
+        self.event_store = ChainlinkEventStore(self.CHAINLINK_EVENTS_DB, self.CHAINLINK_DATA_DIR, self.CTC_DB)
+        self.event_store.sync()
+        missing = self._missing_feeds()
+        if missing:
+            with METRICS.stage('chainlink.initialize'):
+                await self._initialize(missing)
+        with METRICS.stage('chainlink.load'):
             self._load()
-        self._format()
+        with METRICS.stage('chainlink.format'):
+            self._format()
 
-    async def _initialize(self):
-        try:
-            await chainlink_utils.async_get_feed_data(self.CHAINLINK_LUNA_FEED, start_block=self.ETH_STARTING_BLOCK, end_block=self.ETH_ENDING_BLOCK)
-        except:
-            pass
+    async def _initialize(self, pairs):
+        await asyncio.gather(*[
+            chainlink_utils.async_get_feed_data(self.feeds[pair]['chainlink'], start_block=self.ETH_STARTING_BLOCK, end_block=self.ETH_ENDING_BLOCK)
+            for pair in pairs
+        ], return_exceptions=True)
+
+    def _feed_aggregators(self, feed):
+        """
+        Aggregator contracts of a feed: `chainlink_aggregators` in the feed registry,
+        otherwise the ones ctc recorded behind the feed proxy, None when neither knows any
+        """
+        return [aggregator.lower() for aggregator in feed.get('chainlink_aggregators') or []] or self.event_store.aggregators(feed['chainlink'])
+
+    def _missing_feeds(self):
+        """
+        Pairs with no events in the block window yet. ctc records a feed's aggregators
+        when it fetches its events, so pairs without known aggregators are fetched too.
+        """
+        missing = []
+        for pair, feed in self.feeds.items():
+            aggregators = self._feed_aggregators(feed)
+            if not aggregators or not self.event_store.has_events(
+                contracts=aggregators, start_block=self.ETH_STARTING_BLOCK, end_block=self.ETH_ENDING_BLOCK
+            ):
+                missing.append(pair)
+        return missing
+
+    def _aggregators(self):
+        aggregators = {pair: self._feed_aggregators(feed) for pair, feed in self.feeds.items()}
+        unresolved = [pair for pair, pair_aggregators in aggregators.items() if not pair_aggregators]
+        if unresolved:
+            raise Exception(
+                f"No Chainlink aggregators known for {unresolved}: ctc's aggregator registry in {self.event_store.ctc_db_path} has none "
+                f"for their feeds. Sync it with ctc or list the aggregators under 'chainlink_aggregators' in src.feeds.FEEDS"
+            )
+        return aggregators
 
     def _load(self):
-        try:
-            for root, dirs, files in os.walk(self.CHAINLINK_DATA_DIR):
-                files = list(filter(lambda filename: '.csv' in filename, files))
-                for name in files:
-                    fpath = os.path.join(root, name)
-                    new_data = pd.read_csv(fpath)
-                    self.raw_transactions = pd.concat([self.raw_transactions, new_data], ignore_index=True)
-            self.raw_transactions.sort_values(by=['block_number'], inplace=True)
-            self.raw_transactions.reset_index(drop=True, inplace=True)
-        except:
-            pass
+        self.event_store.sync()
+        aggregators = self._aggregators()
+        self.raw_transactions = self.event_store.load(
+            contracts=[aggregator for pair_aggregators in aggregators.values() for aggregator in pair_aggregators],
+            start_block=self.ETH_STARTING_BLOCK,
+            end_block=self.ETH_ENDING_BLOCK
+        )
+        contract_pairs = {aggregator: pair for pair, pair_aggregators in aggregators.items() for aggregator in pair_aggregators}
+        self.raw_transactions['feed'] = self.raw_transactions['contract_address'].map(contract_pairs)
 
     def _format(self):
-        self.price_feeds['price'] = self.raw_transactions['arg__current'] / 10 ** 18
-        self.price_feeds['timestamp'] = self.raw_transactions['arg__updatedAt']
-        self.price_feeds['feed'] = 'luna/eth'
-        self.price_feeds['date'] = pd.to_datetime(self.price_feeds['timestamp'], unit='s')
+        self.ticks = TickArray.from_fixed(
+            self.raw_transactions['feed'].to_numpy(),
+            self.raw_transactions['arg__current'].to_numpy(),
+            self.raw_transactions['arg__updatedAt'].to_numpy(),
+            decimals={pair: feed['chainlink_decimals'] for pair, feed in self.feeds.items()},
+            sources='chainlink'
+        )
+        self._price_feeds = None
+        METRICS.increment('loader_ticks_total', len(self.ticks), source='chainlink')
+
+    @property
+    def price_feeds(self):
+        if self._price_feeds is None:
+            self._price_feeds = self.ticks.to_frame(pair_column='feed')
+        return self._price_feeds
+
+    @price_feeds.setter
+    def price_feeds(self, frame):
+        self._price_feeds = frame
+
+    def get_feed(self, pair):
+        return self.price_feeds[self.price_feeds['feed'] == pair]
 
 
 class KaikoLoader:
-    
-    KAIKO_REQUEST = 'https://us.market-api.kaiko.io/v2/data/trades.v1/spot_direct_exchange_rate/luna/eth?include_exchanges=usp2,usp3,inch,curv,sush,ftxx,bnce,cbse,bfnx&sources=true&start_time=2022-05-06T00:00:10Z&end_time=2022-05-26T00:00:10Z&interval=1h&page_size=100'
-    KAIKO_REQUEST_DEX = 'https://us.market-api.kaiko.io/v2/data/trades.v1/spot_direct_exchange_rate/luna/eth?start_time=2022-05-06T00:00:10Z&end_time=2022-05-26T00:00:10Z&interval=1h&page_size=1000'
-    
-    def __init__(self, exchange_type="CEX"):
+    """
+    Kaiko DataLoader
+
+    The requested window is split into UTC day shards that are paginated concurrently.
+    Complete shards are cached on disk keyed by the normalized request, so repeated
+    or overlapping windows only hit the API for the days not fetched yet. Prices are
+    kept as a TickArray (millisecond timestamps) and the other API columns in `raw_data`,
+    `data` joins them back on first access.
+    """
+
+    KAIKO_API = 'https://us.market-api.kaiko.io/v2/data/trades.v1/spot_direct_exchange_rate'
+    KAIKO_START_TIME = '2022-05-06T00:00:10Z'
+    KAIKO_END_TIME = '2022-05-26T00:00:10Z'
+    KAIKO_PARAMS = {
+        "CEX": {'include_exchanges': 'usp2,usp3,inch,curv,sush,ftxx,bnce,cbse,bfnx', 'sources': 'true', 'interval': '1h', 'page_size': '1000'},
+        "DEX": {'interval': '1h', 'page_size': '1000'},
+    }
+    KAIKO_CACHE_DIR = 'data/kaiko_cache'
+    SHARD_DURATION = pd.Timedelta(days=1)
+    MAX_CONCURRENCY = 8
+    KAIKO_DECIMALS = 18
+
+    def __init__(self, exchange_type="CEX", pairs=DEFAULT_PAIRS, start_time=KAIKO_START_TIME, end_time=KAIKO_END_TIME):
         self.header = {
             'Accept': 'application/json',
             'Connection': 'keep-alive',
             'X-Api-Key': os.environ.get('KAIKO_API_KEY')
         }
-        if exchange_type == "CEX":
-            self.kaiko_requester = NodeRequester(self.KAIKO_REQUEST)
-        elif exchange_type == "DEX":
-            self.kaiko_requester = NodeRequester(self.KAIKO_REQUEST_DEX)
-        else:
-            self.kaiko_requester = NodeRequester(self.KAIKO_REQUEST_DEX)
-        self.data = pd.DataFrame()
-        self._load()
-        self.data = self.data.dropna(subset=['price'])
-        self.data['date'] = pd.to_datetime(self.data['timestamp'], unit='ms')
-        self.data['price'] =pd.to_numeric(self.data['price'])
+        self.request_params = self.KAIKO_PARAMS.get(exchange_type, self.KAIKO_PARAMS["DEX"])
+        self.feeds = feeds_for('kaiko', pairs)
+        # Naive bounds are taken as UTC, the shards and the cache cutoff compare against UTC times
+        self.start_time = self.to_utc(start_time)
+        self.end_time = self.to_utc(end_time)
+        self.cache = ResponseCache(self.KAIKO_CACHE_DIR)
+        self._data = None
+        with METRICS.stage('kaiko.load'):
+            rows = self._load()
+        rows = rows.dropna(subset=['price']).reset_index(drop=True)
+        self.ticks = TickArray.from_prices(
+            rows['feed'].to_numpy(), pd.to_numeric(rows['price']).to_numpy(), rows['timestamp'].to_numpy(),
+            decimals=self.KAIKO_DECIMALS, unit='ms', sources='kaiko'
+        )
+        # Rows stay aligned with the ticks, only the price strings are dropped
+        self.raw_columns = list(rows.columns)
+        self.raw_data = rows.drop(columns=['price'])
+        METRICS.increment('loader_ticks_total', len(self.ticks), source='kaiko')
+
+    @staticmethod
+    def to_utc(value):
+        value = pd.Timestamp(value)
+        return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+
+    def shards(self):
+        shard_start = self.start_time.floor('D')
+        while shard_start < self.end_time:
+            yield shard_start, shard_start + self.SHARD_DURATION
+            shard_start += self.SHARD_DURATION
 
     def _load(self):
+        rows = run_sync(self._fetch())
+        rows = pd.DataFrame(rows, columns=None if rows else ['timestamp', 'price', 'feed'])
+        in_window = (rows['timestamp'] >= self.start_time.value // 10**6) & (rows['timestamp'] < self.end_time.value // 10**6)
+        return rows[in_window].sort_values(by=['feed', 'timestamp']).reset_index(drop=True)
+
+    async def _fetch(self):
+        async with AsyncNodeRequester("", headers=self.header, max_concurrency=self.MAX_CONCURRENCY) as requester:
+            shards = await asyncio.gather(*[
+                self._fetch_shard(requester, pair, feed['kaiko'], start, end)
+                for pair, feed in self.feeds.items() for start, end in self.shards()
+            ])
+        return [row for shard in shards for row in shard]
+
+    async def _fetch_shard(self, requester, pair, kaiko_pair, start, end):
+        url = f"{self.KAIKO_API}/{kaiko_pair}"
+        params = dict(self.request_params, start_time=start.strftime('%Y-%m-%dT%H:%M:%SZ'), end_time=end.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        rows = self.cache.get(url, params)
+        if rows is not None:
+            return [dict(row, feed=pair) for row in rows]
+        rows = []
+        response = await requester.get(url, params=params)
         while True:
-            request = self.kaiko_requester.get(url="", headers=self.header) 
-            if request.status_code != 200 or "error" in request.text:
-                print(request.text)
-                time.sleep(2)
-                continue
-            request= json.loads(request.text)
-            self.data = pd.concat([self.data, pd.DataFrame(request['data'])], ignore_index=True)
-            if request.get('next_url'):
-                self.kaiko_requester = NodeRequester(request['next_url'])
-            else:
-                return
+            if response.get('result') == 'error':
+                raise Exception(f"Kaiko request failed: {response.get('message')}")
+            rows.extend(response['data'])
+            if not response.get('next_url'):
+                break
+            response = await requester.get(response['next_url'])
+        # Shards reaching into the future are still filling up, only cache closed ones
+        if end <= pd.Timestamp.now(tz='UTC'):
+            self.cache.put(url, params, rows)
+        return [dict(row, feed=pair) for row in rows]
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.raw_data.assign(price=self.ticks.prices())[self.raw_columns]
+            self._data['date'] = pd.to_datetime(self.ticks.timestamps, unit='ms')
+        return self._data
+
+    @data.setter
+    def data(self, frame):
+        self._data = frame
+
+    def get_feed(self, pair):
+        return self.data[self.data['feed'] == pair]
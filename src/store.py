@@ -0,0 +1,207 @@
+import os
+import json
+import hashlib
+import sqlite3
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.instrumentation import METRICS
+
+
+class RawTransactionStore:
+    """
+    Parquet store for raw transactions
+
+    Transactions are written as typed columns (calldata and signatures stay list
+    columns) in files partitioned by block range, named like data/historical_parquet:
+    `<first block>_<last block>.parquet`. Reads only open the partitions overlapping
+    the requested block range and only decode the requested columns.
+    """
+
+    PARTITION_SIZE = 5000
+
+    def __init__(self, directory, partition_size=PARTITION_SIZE):
+        self.directory = directory
+        self.partition_size = partition_size
+
+    def exists(self):
+        return len(self.partitions()) > 0
+
+    def partitions(self, start_block=None, end_block=None):
+        if not os.path.isdir(self.directory):
+            return []
+        partitions = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.parquet'):
+                continue
+            first_block, last_block = [int(block) for block in name[:-len('.parquet')].split('_')]
+            if start_block is not None and last_block < start_block:
+                continue
+            if end_block is not None and first_block >= end_block:
+                continue
+            partitions.append(os.path.join(self.directory, name))
+        return partitions
+
+    def write(self, transactions):
+        if transactions.empty:
+            # Nothing to partition, an empty crawl may not even have a block_number column
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        transactions = transactions.sort_values(by=['block_number'], kind='stable')
+        schema = pa.Table.from_pandas(transactions, preserve_index=False).schema
+        for _, partition in transactions.groupby(transactions['block_number'] // self.partition_size):
+            name = f"{partition['block_number'].iloc[0]:010d}_{partition['block_number'].iloc[-1]:010d}.parquet"
+            table = pa.Table.from_pandas(partition, schema=schema, preserve_index=False)
+            pq.write_table(table, os.path.join(self.directory, name))
+
+    def read(self, columns=None, start_block=None, end_block=None):
+        filters = []
+        if start_block is not None:
+            filters.append(('block_number', '>=', start_block))
+        if end_block is not None:
+            filters.append(('block_number', '<', end_block))
+        paths = self.partitions(start_block, end_block)
+        tables = [pq.read_table(path, columns=columns, filters=filters or None) for path in paths]
+        if not tables:
+            return pd.DataFrame(columns=columns)
+        table = pa.concat_tables(tables)
+        METRICS.increment('store_files_read_total', len(paths), store='raw_transactions')
+        METRICS.increment('store_bytes_read_total', sum(os.path.getsize(path) for path in paths), store='raw_transactions')
+        METRICS.increment('store_rows_read_total', table.num_rows, store='raw_transactions')
+        return table.to_pandas()
+
+
+class ChainlinkEventStore:
+    """
+    Indexed SQLite store for the AnswerUpdated events ctc writes as CSV
+
+    `sync` ingests only the CSV files that are new or changed since the last call,
+    and `load` reads the rows of the requested contracts, block and time window
+    through the (contract_address, block_number) and (contract_address, arg__updatedAt)
+    indexes instead of reading every CSV.
+    """
+
+    EVENT_COLUMNS = [
+        'block_number', 'transaction_index', 'log_index', 'transaction_hash',
+        'contract_address', 'arg__current', 'arg__roundId', 'arg__updatedAt'
+    ]
+
+    def __init__(self, db_path, events_dir, ctc_db_path=None):
+        self.db_path = db_path
+        self.events_dir = events_dir
+        self.ctc_db_path = ctc_db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with sqlite3.connect(self.db_path) as connection:
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS ingested_files (path TEXT PRIMARY KEY, mtime REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS answer_updated (
+                    path TEXT NOT NULL, block_number INTEGER NOT NULL, transaction_index INTEGER,
+                    log_index INTEGER NOT NULL, transaction_hash TEXT, contract_address TEXT NOT NULL,
+                    arg__current NUMERIC, arg__roundId INTEGER, arg__updatedAt INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_answer_updated_block ON answer_updated (contract_address, block_number);
+                CREATE INDEX IF NOT EXISTS ix_answer_updated_time ON answer_updated (contract_address, arg__updatedAt);
+            ''')
+
+    def event_files(self):
+        for root, dirs, files in os.walk(self.events_dir):
+            for name in files:
+                if name.endswith('.csv'):
+                    yield os.path.join(root, name)
+
+    def sync(self):
+        with sqlite3.connect(self.db_path) as connection:
+            ingested = dict(connection.execute('SELECT path, mtime FROM ingested_files'))
+            for path in self.event_files():
+                mtime = os.path.getmtime(path)
+                if ingested.get(path) == mtime:
+                    continue
+                events = pd.read_csv(path)
+                if 'arg__updatedAt' not in events:
+                    continue
+                events = events[self.EVENT_COLUMNS].assign(path=path)
+                events['contract_address'] = events['contract_address'].str.lower()
+                if events['arg__current'].dtype == object:
+                    events['arg__current'] = events['arg__current'].astype(float)
+                connection.execute('DELETE FROM answer_updated WHERE path = ?', (path,))
+                events.to_sql('answer_updated', connection, if_exists='append', index=False)
+                connection.execute('INSERT OR REPLACE INTO ingested_files VALUES (?, ?)', (path, mtime))
+                METRICS.increment('store_files_read_total', store='chainlink_events')
+                METRICS.increment('store_bytes_read_total', os.path.getsize(path), store='chainlink_events')
+                METRICS.increment('store_rows_ingested_total', len(events), store='chainlink_events')
+
+    def aggregators(self, feed):
+        """
+        Aggregator contracts behind a feed proxy, as recorded by ctc, or None when unknown
+        """
+        if self.ctc_db_path is None or not os.path.exists(self.ctc_db_path):
+            return None
+        with sqlite3.connect(self.ctc_db_path) as connection:
+            try:
+                rows = connection.execute(
+                    'SELECT DISTINCT aggregator FROM network_1__chainlink_aggregator_updates WHERE feed = ?', (feed.lower(),)
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return None
+        return [aggregator.lower() for aggregator, in rows] or None
+
+    def has_events(self, contracts=None, start_block=None, end_block=None):
+        clauses, params = [], []
+        if contracts is not None:
+            clauses.append(f"contract_address IN ({', '.join('?' * len(contracts))})")
+            params.extend(contract.lower() for contract in contracts)
+        for operator, value in [('>=', start_block), ('<', end_block)]:
+            if value is not None:
+                clauses.append(f"block_number {operator} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with sqlite3.connect(self.db_path) as connection:
+            return connection.execute(f"SELECT 1 FROM answer_updated {where} LIMIT 1", params).fetchone() is not None
+
+    def load(self, contracts=None, start_block=None, end_block=None, start_time=None, end_time=None):
+        clauses, params = [], []
+        if contracts is not None:
+            clauses.append(f"contract_address IN ({', '.join('?' * len(contracts))})")
+            params.extend(contract.lower() for contract in contracts)
+        for column, operator, value in [
+            ('block_number', '>=', start_block), ('block_number', '<', end_block),
+            ('arg__updatedAt', '>=', start_time), ('arg__updatedAt', '<', end_time),
+        ]:
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = f"SELECT {', '.join(self.EVENT_COLUMNS)} FROM answer_updated {where} ORDER BY block_number, log_index"
+        with sqlite3.connect(self.db_path) as connection:
+            events = pd.read_sql_query(query, connection, params=params)
+        METRICS.increment('store_rows_read_total', len(events), store='chainlink_events')
+        return events
+
+
+class ResponseCache:
+    """
+    On-disk JSON cache of API responses keyed by the normalized request (url and sorted params)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, url, params):
+        request = json.dumps({'url': url, 'params': sorted((str(k), str(v)) for k, v in params.items())})
+        return os.path.join(self.directory, f"{hashlib.sha1(request.encode()).hexdigest()}.json")
+
+    def get(self, url, params):
+        path = self.path(url, params)
+        if not os.path.exists(path):
+            METRICS.increment('cache_misses_total', cache=os.path.basename(self.directory))
+            return None
+        METRICS.increment('cache_hits_total', cache=os.path.basename(self.directory))
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def put(self, url, params, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(url, params)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(data, f)
+        os.replace(f"{path}.tmp", path)
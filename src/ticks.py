@@ -0,0 +1,225 @@
+"""
+Compact columnar container for price ticks.
+
+Labels (pair, source, publisher) are dictionary encoded into small integer codes,
+prices are int64 fixed point with per-pair decimals and timestamps int64 epochs,
+so a tick costs a few tens of bytes instead of a row of Python strings and floats.
+DataFrames and float prices are only built when a consumer asks for them.
+"""
+import numpy as np
+import pandas as pd
+
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def code_dtype(size):
+    for dtype in [np.int8, np.int16, np.int32]:
+        if size <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def encode_labels(labels, size):
+    """
+    Returns (codes, dictionary) for `labels`, a scalar label being repeated `size` times.
+    Missing labels get code -1, and codes use the smallest integer type holding the dictionary.
+    """
+    if labels is None:
+        return np.full(size, -1, dtype=np.int8), np.array([], dtype=object)
+    if np.isscalar(labels):
+        return np.zeros(size, dtype=np.int8), np.array([labels], dtype=object)
+    codes, dictionary = pd.factorize(np.asarray(labels, dtype=object))
+    return codes.astype(code_dtype(len(dictionary))), np.asarray(dictionary, dtype=object)
+
+
+def storage_decimals(max_abs_value, decimals):
+    """
+    Largest number of decimals <= `decimals` at which `max_abs_value` (in units) fits in int64
+    """
+    while decimals > 0 and max_abs_value * 10.0 ** decimals >= INT64_MAX:
+        decimals -= 1
+    return decimals
+
+
+def remap_codes(codes, dictionary, merged):
+    position = {label: index for index, label in enumerate(merged)}
+    # The trailing -1 keeps missing labels missing
+    lookup = np.array([position[label] for label in dictionary] + [-1], dtype=code_dtype(len(merged)))
+    return lookup[codes]
+
+
+class TickArray:
+    """
+    Price ticks as parallel numpy arrays
+
+    - pair_codes / pairs: dictionary encoded pair of every tick
+    - decimals: fixed point decimals of every pair, aligned with `pairs`
+    - values: int64 fixed point prices, price = value / 10 ** decimals[pair_code]
+    - timestamps: int64 epochs in `unit` ('s' or 'ms')
+    - source_codes / sources, publisher_codes / publishers: optional dictionary encoded labels
+    """
+
+    def __init__(self, pair_codes, pairs, decimals, values, timestamps, unit='s',
+                 source_codes=None, sources=None, publisher_codes=None, publishers=None):
+        size = len(values)
+        self.pair_codes, self.pairs = np.asarray(pair_codes), np.asarray(pairs, dtype=object)
+        self.decimals = np.asarray(decimals, dtype=np.int8)
+        self.values = np.asarray(values, dtype=np.int64)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.unit = unit
+        if source_codes is None:
+            source_codes, sources = encode_labels(None, size)
+        if publisher_codes is None:
+            publisher_codes, publishers = encode_labels(None, size)
+        self.source_codes, self.sources = np.asarray(source_codes), np.asarray(sources, dtype=object)
+        self.publisher_codes, self.publishers = np.asarray(publisher_codes), np.asarray(publishers, dtype=object)
+
+    @classmethod
+    def empty(cls, unit='s'):
+        return cls(np.zeros(0, dtype=np.int8), [], [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), unit)
+
+    @classmethod
+    def from_prices(cls, pairs, prices, timestamps, decimals, unit='s', sources=None, publishers=None):
+        """
+        Builds a TickArray from float prices in units.
+
+        `decimals` is an int or a {pair: decimals} mapping. A pair whose prices would
+        overflow int64 at its decimals is stored with fewer.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        pair_codes, pair_dictionary = encode_labels(pairs, len(prices))
+        pair_decimals = []
+        for code, pair in enumerate(pair_dictionary):
+            wanted = decimals.get(pair) if isinstance(decimals, dict) else decimals
+            pair_prices = prices[pair_codes == code]
+            largest = np.nanmax(np.abs(pair_prices)) if len(pair_prices) else 0.0
+            pair_decimals.append(storage_decimals(largest, wanted))
+        pair_decimals = np.asarray(pair_decimals, dtype=np.int8)
+        scale = 10.0 ** pair_decimals[pair_codes] if len(pair_decimals) else np.ones(0)
+        return cls(
+            pair_codes, pair_dictionary, pair_decimals, np.rint(prices * scale), timestamps, unit,
+            *encode_labels(sources, len(prices)), *encode_labels(publishers, len(prices))
+        )
+
+    @classmethod
+    def from_fixed(cls, pairs, values, timestamps, decimals, unit='s', sources=None, publishers=None):
+        """
+        Builds a TickArray from fixed point integers (an int64 array or Python ints).
+
+        Values too large for int64 at their decimals (18 decimal USD prices) are
+        rescaled with exact integer division.
+        """
+        values = np.asarray(values)
+        pair_codes, pair_dictionary = encode_labels(pairs, len(values))
+        pair_decimals = np.zeros(len(pair_dictionary), dtype=np.int8)
+        stored = np.zeros(len(values), dtype=np.int64)
+        for code, pair in enumerate(pair_dictionary):
+            wanted = decimals.get(pair) if isinstance(decimals, dict) else decimals
+            mask = pair_codes == code
+            pair_values = values[mask]
+            if pair_values.dtype == object:
+                largest = max((abs(int(value)) for value in pair_values), default=0)
+                kept = storage_decimals(largest / 10.0 ** wanted, wanted)
+                divisor = 10 ** (wanted - kept)
+                stored[mask] = [int(value) // divisor for value in pair_values]
+            else:
+                kept = wanted
+                stored[mask] = np.rint(pair_values).astype(np.int64)
+            pair_decimals[code] = kept
+        return cls(
+            pair_codes, pair_dictionary, pair_decimals, stored, timestamps, unit,
+            *encode_labels(sources, len(values)), *encode_labels(publishers, len(values))
+        )
+
+    @staticmethod
+    def concat(arrays):
+        """
+        Concatenates TickArrays, merging their dictionaries. A pair keeps the fewest decimals it has in any array.
+        """
+        arrays = [array for array in arrays if len(array)]
+        if not arrays:
+            return TickArray.empty()
+        units = {array.unit for array in arrays}
+        if len(units) > 1:
+            raise Exception(f"Cannot concatenate ticks with different time units {units}")
+        merged = {}
+        for name in ['pairs', 'sources', 'publishers']:
+            merged[name] = np.asarray(list(dict.fromkeys(label for array in arrays for label in getattr(array, name))), dtype=object)
+        decimals = {}
+        for array in arrays:
+            for pair, pair_decimals in zip(array.pairs, array.decimals):
+                decimals[pair] = min(decimals.get(pair, pair_decimals), pair_decimals)
+        values = []
+        for array in arrays:
+            # A pair stored with more decimals in one array is brought down to the common ones
+            divisors = 10 ** (array.decimals.astype(np.int64) - [decimals[pair] for pair in array.pairs])
+            values.append(array.values // divisors[array.pair_codes] if np.any(divisors > 1) else array.values)
+        codes = {
+            name: np.concatenate([
+                remap_codes(getattr(array, f'{name[:-1]}_codes'), getattr(array, name), merged[name]) for array in arrays
+            ]) for name in merged
+        }
+        return TickArray(
+            codes['pairs'], merged['pairs'], [decimals[pair] for pair in merged['pairs']],
+            np.concatenate(values),
+            np.concatenate([array.timestamps for array in arrays]),
+            arrays[0].unit, codes['sources'], merged['sources'], codes['publishers'], merged['publishers']
+        )
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in [
+            'pair_codes', 'decimals', 'values', 'timestamps', 'source_codes', 'publisher_codes'
+        ])
+
+    def take(self, indices):
+        return TickArray(
+            self.pair_codes[indices], self.pairs, self.decimals, self.values[indices], self.timestamps[indices],
+            self.unit, self.source_codes[indices], self.sources, self.publisher_codes[indices], self.publishers
+        )
+
+    def select(self, pairs=None, sources=None, start=None, end=None):
+        """
+        Ticks of `pairs` and `sources` with start <= timestamp < end (epochs in `unit`)
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if pairs is not None:
+            mask &= np.isin(self.pair_codes, np.flatnonzero(np.isin(self.pairs, list(pairs))))
+        if sources is not None:
+            mask &= np.isin(self.source_codes, np.flatnonzero(np.isin(self.sources, list(sources))))
+        if start is not None:
+            mask &= self.timestamps >= start
+        if end is not None:
+            mask &= self.timestamps < end
+        return self.take(np.flatnonzero(mask))
+
+    def prices(self):
+        """
+        Float prices in units
+        """
+        return self.values / 10.0 ** self.decimals[self.pair_codes]
+
+    def labels(self, name):
+        codes = getattr(self, f'{name[:-1]}_codes')
+        return pd.Categorical.from_codes(codes.astype(np.int32), getattr(self, name))
+
+    def to_frame(self, pair_column='pair', dates=True, fixed=False):
+        """
+        DataFrame view of the ticks: timestamp, price (float, or the int64 fixed point
+        value when `fixed`), the pair under `pair_column`, source/publisher when set,
+        and a `date` column when `dates`
+        """
+        frame = pd.DataFrame({
+            'timestamp': self.timestamps,
+            'price': self.values if fixed else self.prices(),
+            pair_column: self.labels('pairs'),
+        })
+        for name, column in [('sources', 'source'), ('publishers', 'publisher')]:
+            if len(getattr(self, name)):
+                frame[column] = self.labels(name)
+        if dates:
+            frame['date'] = pd.to_datetime(self.timestamps, unit=self.unit)
+        return frame
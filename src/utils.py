@@ -1,4 +1,7 @@
 from starkware.starknet.compiler.compile import get_selector_from_name as starkware_get_selector_from_name
+from src.felts import felts_to_int, felts_to_float, decode_short_strings
+import numpy as np
+import pandas as pd
 
 def get_selector_from_name(name):
     return starkware_get_selector_from_name(name)
@@ -39,6 +42,74 @@ def to_unit(value, decimal):
 def get_struct(structs, name):
     return list(filter(lambda x: x['name'] in name, structs))[0]
 
+FELT, FELT_ARRAY, STRUCT, STRUCT_ARRAY = range(4)
+
+
+def compile_members(members, structs):
+    """
+    Compiles ABI members into a decode plan: a list of (name, type, kind, struct plan).
+    `<name>_len` members are folded into the pointer that follows them, as the
+    length is read by the pointer step. Flat (felt only) structs compile to a
+    tuple of member names so arrays of them can be sliced by fixed width.
+    """
+    plan = []
+    for index, member in enumerate(members):
+        if len(members) > index+1 and members[index+1]['type'].endswith('*'):
+            continue
+        member_type = member['type']
+        is_array = member_type.endswith('*')
+        base_type = member_type.rstrip('*')
+        if base_type == "felt":
+            plan.append((member['name'], member_type, FELT_ARRAY if is_array else FELT, None))
+            continue
+        struct_plan = compile_members(structs[base_type]['members'], structs)
+        if all(kind == FELT for _, _, kind, _ in struct_plan):
+            struct_plan = tuple(name for name, _, _, _ in struct_plan)
+        plan.append((member['name'], member_type, STRUCT_ARRAY if is_array else STRUCT, struct_plan))
+    return plan
+
+
+def decode_members(plan, calldata, cursor=0):
+    """
+    Decodes calldata with a plan from compile_members by moving an index cursor.
+    Returns the {name: value} dict and the cursor position after the last member.
+    """
+    values = {}
+    for name, _, kind, struct_plan in plan:
+        if kind == FELT:
+            values[name] = calldata[cursor]
+            cursor += 1
+        elif kind == FELT_ARRAY:
+            length = int(calldata[cursor], 16)
+            values[name] = list(calldata[cursor+1:cursor+1+length])
+            cursor += 1 + length
+        elif kind == STRUCT:
+            values[name], cursor = decode_struct(struct_plan, calldata, cursor)
+        else:
+            length = int(calldata[cursor], 16)
+            cursor += 1
+            if isinstance(struct_plan, tuple):
+                width = len(struct_plan)
+                values[name] = [
+                    dict(zip(struct_plan, calldata[position:position+width]))
+                    for position in range(cursor, cursor + length * width, width)
+                ]
+                cursor += length * width
+            else:
+                values[name] = []
+                for _ in range(length):
+                    value, cursor = decode_members(struct_plan, calldata, cursor)
+                    values[name].append(value)
+    return values, cursor
+
+
+def decode_struct(struct_plan, calldata, cursor):
+    if isinstance(struct_plan, tuple):
+        width = len(struct_plan)
+        return dict(zip(struct_plan, calldata[cursor:cursor+width])), cursor + width
+    return decode_members(struct_plan, calldata, cursor)
+
+
 class DataParser:
 
     def __init__(self, selector_name, data, members, structs) -> None:
@@ -50,71 +121,36 @@ class DataParser:
         self.initialize()
 
     def initialize(self):
-        for index, member in enumerate(self.members):
-            member_type = member['type']
-            if len(self.members) > index+1 and self.members[index+1]['type'].endswith('*'):
-                continue
-            if member['type'].endswith('*') and int(self.raw_data[0], 16) == 0:
-                value = []
-                self.raw_data = self.raw_data[1:]
-            elif member['type'] == "felt":
-                value = self.raw_data[:1][0]
-                self.raw_data = self.raw_data[1:]
-            elif member['type'] == "felt*":
-                length = int(self.raw_data[0], 16)
-                value = self.raw_data[1:length+1]
-                self.raw_data = self.raw_data[length+1:]
-            elif member['type'].endswith('*'):
-                object_length = int(self.raw_data[0], 16)
-                self.raw_data = self.raw_data[1:]
-                value = [self.build_member_value(member) for i in range(object_length)]
-            else:
-                value = self.build_member_value(member)
-            member_value = {
-                "name": member['name'],
-                "type": member_type,
-                "value": value
-            }
-            self.data.append(member_value)
-
-    def build_member_value(self, member):
-        current_struct = get_struct(self.structs, member['type'])
-        struct_val = {}
-        for index, struct_member in enumerate(current_struct['members']):
-            if len(current_struct['members']) > index+1 and current_struct['members'][index+1]['type'].endswith('*'):
-                continue
-            elif struct_member['type'].endswith('*') and int(self.raw_data[0], 16) == 0:
-                struct_val[struct_member['name']] = []
-                self.raw_data = self.raw_data[1:]
-            if struct_member['type'] == "felt":
-                val = self.raw_data[:1][0]
-                self.raw_data = self.raw_data[1:]
-                struct_val[struct_member['name']] = val
-            elif struct_member['type'] == "felt*":
-                length = int(self.raw_data[0], 16)
-                val = self.raw_data[1:length+1]
-                self.raw_data = self.raw_data[length+1:]
-                struct_val[struct_member['name']] = val
-            elif struct_member['type'].endswith('*'):
-                object_length = int(self.raw_data[0], 16)
-                self.raw_data = self.raw_data[1:]
-                struct_val[struct_member['name']] = [self.build_member_value(member) for i in range(object_length)]
-            else:
-                struct_val[struct_member['name']] = self.build_member_value(struct_member)
-        return struct_val
+        plan = compile_members(self.members, {struct['name']: struct for struct in self.structs})
+        values, cursor = decode_members(plan, self.raw_data)
+        self.raw_data = self.raw_data[cursor:]
+        self.data = [
+            {"name": name, "type": member_type, "value": values[name]}
+            for name, member_type, _, _ in plan
+        ]
 
 
 def normalize_submit_many_entry(data):
+    """
+    Normalized entries of a submit_many_entries call, given DataParser.data (a list of
+    name/type/value members) or a name -> value mapping. None when there are no entries
+    or they can't be decoded.
+    """
+    if isinstance(data, dict):
+        price_feed = data.get('new_entries')
+    else:
+        price_feed = next((member.get('value') for member in data if member['name'] == "new_entries"), None)
+    if price_feed is None:
+        return None
     try:
-        price_feed = list(filter(lambda x: x['name'] == "new_entries", data))[0].get('value')
-        normalized_feed = [{
+        return [{
             'feed': hex_string_to_string(feed.get('key')),
             'price': hex_string_to_decimal(feed.get('value')),
             'timestamp': hex_string_to_decimal(feed.get('timestamp')),
             'publisher': hex_string_to_string(feed.get('publisher'))
         } for feed in price_feed]
-        return normalized_feed
-    except:
+    except (TypeError, ValueError):
+        # Malformed felts (odd hex, non UTF-8 short strings)
         return None
 
 def filter_feeds(feed, feed_data):
@@ -124,3 +160,43 @@ def combine_pair(feed_data):
     luna_usd_feed = [entry['price'] for entry in filter_feeds('luna/usd', feed_data)]
     eth_usd_feed = [entry['price'] for entry in filter_feeds('eth/usd', feed_data)]
     return [luna_price / eth_price for luna_price, eth_price in zip(luna_usd_feed, eth_usd_feed)]
+
+
+def entries_table(positions, columns):
+    """
+    Builds the long-format entries table (feed, publisher, price, timestamp, tx)
+    from the Entry columns of CalldataDecoder.extract_struct_array.
+    `tx` is the position of the transaction the entry was submitted in.
+    """
+    return pd.DataFrame({
+        'feed': decode_short_strings(columns.get('key', [])),
+        'publisher': decode_short_strings(columns.get('publisher', [])),
+        'price': felts_to_float(columns.get('value', [])),
+        'timestamp': felts_to_int(columns.get('timestamp', [])),
+        'tx': np.asarray(positions, dtype=np.int64),
+    })
+
+
+def combine_pair_table(entries, base_feed='luna/usd', quote_feed='eth/usd'):
+    """
+    Grouped counterpart of combine_pair: within each transaction the n-th base entry
+    is divided by the n-th quote entry, and the median ratio is returned per tx
+    """
+    legs = entries[entries['feed'].isin([base_feed, quote_feed])]
+    legs = legs.assign(
+        feed=legs['feed'].astype(str),
+        rank=legs.groupby(['tx', legs['feed'].astype(str)]).cumcount()
+    )
+    wide = legs.pivot(index=['tx', 'rank'], columns='feed', values='price')
+    if base_feed not in wide or quote_feed not in wide:
+        return pd.Series(dtype=np.float64, name='price')
+    ratios = (wide[base_feed] / wide[quote_feed]).dropna()
+    return ratios.groupby(level='tx').median().rename('price')
+
+
+def direct_pair_table(entries, feed, decimals):
+    """
+    Median price per tx of a feed Empiric publishes directly, in units
+    """
+    legs = entries[entries['feed'] == feed]
+    return (legs.groupby('tx')['price'].median() / 10 ** decimals).rename('price')